@@ -0,0 +1,105 @@
+"""Analyse multi-résolution adaptative.
+
+La plupart des photos de poubelles sont des gros plans : une passe à 320
+suffit. Chaque image est d'abord analysée en basse résolution, puis reprise à
+640 seulement si aucune détection n'atteint le seuil de confiance ou si deux
+détections de classes différentes se recouvrent (cas ambigu). En dernier
+recours, une image encore incertaine peut passer en mode tuilé. La part des
+images escaladées est comptée et écrite régulièrement dans les logs.
+"""
+import threading
+from collections import Counter, namedtuple
+from contextlib import nullcontext
+
+import numpy as np
+
+import detection
+from pretraitement import downscale, map_boxes
+from tuilage import predict_tiled
+
+LOW_IMGSZ = 320
+MIN_CONFIDENCE = 0.5
+AMBIGUITY_IOU = 0.5
+
+AdaptiveResult = namedtuple("AdaptiveResult", ["detections", "result", "prepared", "level", "reason"])
+
+
+def escalation_rate(levels):
+    """Part des niveaux au-delà de la basse résolution"""
+    levels = list(levels)
+    return sum(level != str(LOW_IMGSZ) for level in levels) / len(levels) if levels else 0.0
+
+
+class EscalationStats:
+    """Répartition des images par niveau final (320, 640, tuilé)"""
+
+    def __init__(self, log_every=100):
+        self.log_every = log_every
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, levels):
+        with self._lock:
+            before = sum(self.counts.values())
+            self.counts.update(levels)
+            total = sum(self.counts.values())
+        if self.log_every and total // self.log_every > before // self.log_every:
+            print(f"📈 Escalade adaptative : {self.rate():.0%} sur {total} image(s) ({dict(self.counts)})", flush=True)
+
+    def rate(self):
+        """Part des images analysées au-delà de la basse résolution, tous appels confondus (processus entier)"""
+        with self._lock:
+            total = sum(self.counts.values())
+            return 1.0 - self.counts[str(LOW_IMGSZ)] / total if total else 0.0
+
+
+ESCALATIONS = EscalationStats()
+
+
+def escalation_reason(detections, min_conf=MIN_CONFIDENCE, ambiguity_iou=AMBIGUITY_IOU):
+    """Motif d'escalade, ou None si les détections sont fiables"""
+    if not detections or max(d["confidence"] for d in detections) < min_conf:
+        return "confiance faible"
+    boxes = np.array([d["box"] for d in detections], dtype=np.float32)
+    classes = np.array([d["class_id"] for d in detections])
+    overlap = detection.box_iou(boxes, boxes) >= ambiguity_iou
+    if (overlap & (classes[:, None] != classes[None, :])).any():
+        return "classes en conflit"
+    return None
+
+
+def predict_adaptive(model, prepared_list, low_imgsz=LOW_IMGSZ, conf=detection.DEFAULT_CONF,
+                     min_conf=MIN_CONFIDENCE, ambiguity_iou=AMBIGUITY_IOU, load_full=None,
+                     timings=None, stats=ESCALATIONS):
+    """Analyse adaptative d'un lot d'images letterboxées à pleine taille (640).
+
+    `load_full(i)` retourne l'image BGR pleine résolution de l'image i : s'il est
+    fourni, une image encore incertaine à 640 passe en mode tuilé.
+    """
+    stage = timings.stage if timings is not None else (lambda name: nullcontext())
+    full_imgsz = prepared_list[0].array.shape[0]
+
+    low = [downscale(p, low_imgsz) for p in prepared_list]
+    with stage(f"inference_{low_imgsz}"):
+        results = detection.predict(model, [p.array for p in low], conf=conf, imgsz=low_imgsz)
+    outputs = []
+    for p, r in zip(low, results):
+        dets = map_boxes(detection.extract_detections(model, r), p)
+        outputs.append(AdaptiveResult(dets, r, p, str(low_imgsz), escalation_reason(dets, min_conf, ambiguity_iou)))
+
+    escalated = [i for i, o in enumerate(outputs) if o.reason]
+    if escalated:
+        with stage(f"inference_{full_imgsz}"):
+            results = detection.predict(model, [prepared_list[i].array for i in escalated], conf=conf,
+                                        imgsz=full_imgsz)
+        for i, r in zip(escalated, results):
+            dets = map_boxes(detection.extract_detections(model, r), prepared_list[i])
+            reason = escalation_reason(dets, min_conf, ambiguity_iou)
+            outputs[i] = AdaptiveResult(dets, r, prepared_list[i], str(full_imgsz), reason or outputs[i].reason)
+            if reason and load_full is not None:
+                with stage("inference_tiled"):
+                    dets = predict_tiled(model, load_full(i), tile=full_imgsz, conf=conf)
+                outputs[i] = AdaptiveResult(dets, None, None, "tuilé", reason)
+
+    stats.record(o.level for o in outputs)
+    return outputs
@@ -0,0 +1,142 @@
+"""Banc d'essai du chemin de prédiction de l'application.
+
+Mesure, sur un jeu d'images fixe, le chemin exact de `poubelle.py` (décodage et
+letterbox, `detection.predict`, extraction des boîtes) en faisant varier la
+taille d'image, la taille de lot, le nombre de threads et le backend. Chaque
+configuration tourne dans un processus neuf, pour que le nombre de threads et
+le pic de mémoire (RSS) lui soient propres. Seul PyTorch suit `--threads` :
+ONNX Runtime et OpenVINO, chargés par Ultralytics, gardent leur propre pool
+de threads, si bien qu'ils sont mesurés une seule fois, avec `threads=auto`.
+
+Utilisation :
+    python benchmark.py --imgsz 320 480 640 --batch 1 4 8 --threads 1 2 4 --backend pytorch onnx
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import detection
+from donnees import limit_threads, list_images
+
+IMAGES_DIR = "detection_poubelle.v1i.yolov8/valid/images"
+OUTPUT_CSV = "runs/benchmark/benchmark.csv"
+FIELDS = [
+    "date", "model", "backend", "imgsz", "batch", "threads", "images",
+    "latency/p50(ms)", "latency/p95(ms)", "latency/p99(ms)",
+    "throughput(img/s)", "memory/peak_rss(MB)",
+]
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus courant, en Mo"""
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_config(weights, backend, imgsz, batch, threads, files, warmup, repeats):
+    """Mesure une configuration ; exécuté dans un processus dédié"""
+    import torch
+    if threads:
+        limit_threads(threads)
+
+    from pretraitement import map_boxes, prepare
+
+    model, loaded_backend = detection.load_model_with_backend(weights, backend)
+    if model is None or loaded_backend != backend:
+        return None
+
+    buffers = np.empty((batch, imgsz, imgsz, 3), dtype=np.uint8)
+    batches = [files[i:i + batch] for i in range(0, len(files), batch)]
+
+    def run_batch(paths):
+        prepared = [prepare(p, imgsz, out=buffers[j]) for j, p in enumerate(paths)]
+        results = detection.predict(model, [p.array for p in prepared], imgsz=imgsz)
+        for p, r in zip(prepared, results):
+            map_boxes(detection.extract_detections(model, r), p)
+
+    for paths in batches[:warmup]:
+        run_batch(paths)
+
+    latencies, images = [], 0
+    for _ in range(repeats):
+        for paths in batches:
+            start = time.perf_counter()
+            run_batch(paths)
+            latencies.append((time.perf_counter() - start) * 1000)
+            images += len(paths)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        # Nombre réellement en vigueur ; les runtimes exportés ne l'exposent pas
+        "threads": torch.get_num_threads() if loaded_backend == "pytorch" else "auto",
+        "latency/p50(ms)": round(float(p50), 3),
+        "latency/p95(ms)": round(float(p95), 3),
+        "latency/p99(ms)": round(float(p99), 3),
+        "throughput(img/s)": round(images / (sum(latencies) / 1000), 3),
+        "memory/peak_rss(MB)": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du chemin de prédiction")
+    parser.add_argument("--weights", default=detection.MODEL_PATH)
+    parser.add_argument("--images", default=IMAGES_DIR, help="Dossier du jeu d'images fixe")
+    parser.add_argument("--limit", type=int, default=64, help="Nombre d'images utilisées (0 = toutes)")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--backend", nargs="+", choices=detection.BACKENDS, default=["pytorch"])
+    parser.add_argument("--warmup", type=int, default=2, help="Lots de chauffe non mesurés")
+    parser.add_argument("--repeats", type=int, default=3, help="Passages sur le jeu d'images")
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    args = parser.parse_args()
+
+    files = list_images(args.images)
+    files = files[:args.limit] if args.limit else files
+    if not files:
+        raise SystemExit(f"❌ Aucune image dans {args.images}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    write_header = not os.path.exists(args.output)
+    date = datetime.now().isoformat(timespec="seconds")
+    context = multiprocessing.get_context("spawn")
+
+    with open(args.output, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if write_header:
+            writer.writeheader()
+        # Seul PyTorch applique la limite de threads : les autres backends sont mesurés une fois
+        configs = [(backend, imgsz, batch, threads)
+                   for backend in args.backend
+                   for imgsz, batch, threads in itertools.product(
+                       args.imgsz, args.batch, args.threads if backend == "pytorch" else [None])]
+        for backend, imgsz, batch, threads in configs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                metrics = executor.submit(run_config, args.weights, backend, imgsz, batch, threads,
+                                          files, args.warmup, args.repeats).result()
+            if metrics is None:
+                print(f"⚠️ Backend {backend} indisponible pour {args.weights}, configuration ignorée")
+                continue
+            row = {"date": date, "model": os.path.basename(args.weights), "backend": backend,
+                   "imgsz": imgsz, "batch": batch, "images": len(files), **metrics}
+            writer.writerow(row)
+            f.flush()
+            print(f"{backend:>8} imgsz={imgsz:<4} batch={batch:<3} threads={metrics['threads']:<4} "
+                  f"p50={metrics['latency/p50(ms)']:.1f}ms p95={metrics['latency/p95(ms)']:.1f}ms "
+                  f"p99={metrics['latency/p99(ms)']:.1f}ms {metrics['throughput(img/s)']:.1f} img/s "
+                  f"RSS={metrics['memory/peak_rss(MB)']:.0f}MB")
+    print(f"✅ Résultats ajoutés à {args.output}")
+
+
+if __name__ == "__main__":
+    main()
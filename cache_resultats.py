@@ -0,0 +1,288 @@
+"""Cache des résultats d'analyse, indexé par le contenu de l'image.
+
+La clé combine l'empreinte des octets de l'image, l'empreinte du fichier de
+poids et les paramètres de prédiction (`conf`, `imgsz`). Deux niveaux :
+un LRU en mémoire et un niveau disque optionnel, chacun borné en octets.
+Quand un fichier de poids change, les entrées calculées avec son ancienne
+version sont purgées ; les dernières empreintes vues sont enregistrées avec le
+niveau disque, si bien qu'un changement survenu pendant un arrêt est purgé au
+redémarrage. Les valeurs sont stockées en JSON (les octets, comme les JPEG
+annotés, sont ajoutés bruts à la suite) : jamais de `pickle` sur des fichiers
+que d'autres utilisateurs pourraient écrire.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+DISK_SUFFIX = ".res"
+HASHES_FILE = "model_hashes.json"
+# L'empreinte du modèle ouvre la clé : le type (`kind`) peut contenir des tirets sans gêner la purge
+KEY_PATTERN = re.compile(r"[0-9a-f]{16}-")
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def _weight_files(path):
+    """Fichiers constituant des poids : le fichier lui-même, ou le contenu d'un dossier exporté"""
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(path) for f in files)
+
+
+def file_signature(path):
+    """Signature bon marché (dates et tailles) d'un fichier ou dossier de poids"""
+    signature = []
+    for name in _weight_files(path):
+        stat = os.stat(name)
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def file_hash(path):
+    """Empreinte SHA-256 d'un fichier (ou dossier), recalculée seulement si sa signature change"""
+    signature = file_signature(path)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    digest = hashlib.sha256()
+    for name, _, _ in signature:
+        with open(name, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    with _file_hashes_lock:
+        _file_hashes[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def encode_value(value):
+    """Valeur JSON (listes, dictionnaires, nombres, textes, octets) -> octets"""
+    blobs = []
+
+    def blob(obj):
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            blobs.append(bytes(obj))
+            return {"__blob__": len(blobs) - 1}
+        raise TypeError(f"type non sérialisable en cache : {type(obj).__name__}")
+
+    header = json.dumps(value, default=blob, ensure_ascii=False).encode("utf-8")
+    return b"".join([struct.pack("<I", len(header)), header]
+                    + [struct.pack("<Q", len(b)) + b for b in blobs])
+
+
+def decode_value(payload):
+    """Inverse de `encode_value`"""
+    (header_size,) = struct.unpack_from("<I", payload, 0)
+    offset = 4 + header_size
+    blobs = []
+    while offset < len(payload):
+        (size,) = struct.unpack_from("<Q", payload, offset)
+        blobs.append(payload[offset + 8:offset + 8 + size])
+        offset += 8 + size
+    return json.loads(payload[4:4 + header_size].decode("utf-8"),
+                      object_hook=lambda d: blobs[d["__blob__"]] if d.keys() == {"__blob__"} else d)
+
+
+def make_key(image_bytes, model_hash, conf, imgsz, kind="detections"):
+    """Clé de cache : contenu de l'image + modèle + paramètres de prédiction"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{model_hash[:16]}-{kind}-{conf:g}-{imgsz}-{digest}"
+
+
+class ResultCache:
+    """Cache LRU en mémoire, doublé d'un niveau disque optionnel"""
+
+    def __init__(self, model_path=None, max_memory_bytes=256 << 20, disk_dir=None, max_disk_bytes=2 << 30):
+        self.model_path = model_path
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._model_hashes = {}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+            self._load_model_hashes()
+
+    def model_hash(self, model_path=None, current=None):
+        """Empreinte d'un modèle (celle du modèle réellement chargé si `current` est fourni).
+
+        Purge les entrées de son ancienne empreinte si elle a changé.
+        """
+        model_path = model_path or self.model_path
+        current = current or file_hash(model_path)
+        with self._lock:
+            previous = self._model_hashes.get(model_path)
+            if previous != current:
+                if previous is not None:
+                    self._purge_model_locked(previous)
+                self._model_hashes[model_path] = current
+                self._save_model_hashes_locked()
+        return current
+
+    def key(self, image_bytes, conf, imgsz, kind="detections", model_path=None, model_hash=None):
+        return make_key(image_bytes, self.model_hash(model_path, model_hash), conf, imgsz, kind)
+
+    def get(self, key):
+        """Retourne la valeur en cache, ou None"""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return decode_value(payload)
+            if key in self._disk:
+                try:
+                    with open(self._disk_path(key), "rb") as f:
+                        payload = f.read()
+                except OSError:
+                    self._disk_bytes -= self._disk.pop(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self._put_memory(key, payload)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return decode_value(payload)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        payload = encode_value(value)
+        with self._lock:
+            self._put_memory(key, payload)
+            if self.disk_dir:
+                self._put_disk(key, payload)
+
+    def stats(self):
+        """Compteurs de succès/échecs et occupation des deux niveaux"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def trim_memory(self, max_bytes):
+        """Réduit le niveau mémoire à `max_bytes` (entrées les plus anciennes d'abord) ; le disque est conservé"""
+        with self._lock:
+            while self._memory and self._memory_bytes > max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _put_memory(self, key, payload):
+        if len(payload) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = payload
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _put_disk(self, key, payload):
+        if len(payload) > self.max_disk_bytes or key in self._disk:
+            return
+        tmp_path = self._disk_path(key) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            return
+        self._disk[key] = len(payload)
+        self._disk_bytes += len(payload)
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._remove_disk_file(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + DISK_SUFFIX)
+
+    def _remove_disk_file(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _load_disk_index(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                # Ancien format pickle : jamais relu
+                self._remove_file(entry.path)
+            elif entry.is_file() and entry.name.endswith(DISK_SUFFIX) and not KEY_PATTERN.match(entry.name):
+                # Ancien format de clé (type en tête) : sa purge par modèle serait impossible
+                self._remove_file(entry.path)
+            elif entry.is_file() and entry.name.endswith(DISK_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(DISK_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _load_model_hashes(self):
+        try:
+            with open(os.path.join(self.disk_dir, HASHES_FILE)) as f:
+                self._model_hashes = json.load(f)
+        except (OSError, ValueError):
+            self._model_hashes = {}
+
+    def _save_model_hashes_locked(self):
+        if not self.disk_dir:
+            return
+        path = os.path.join(self.disk_dir, HASHES_FILE)
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(self._model_hashes, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _purge_model_locked(self, model_hash):
+        prefix = model_hash[:16]
+        for key in [k for k in self._memory if k.startswith(prefix + "-")]:
+            self._memory_bytes -= len(self._memory.pop(key))
+        for key in [k for k in self._disk if k.startswith(prefix + "-")]:
+            self._disk_bytes -= self._disk.pop(key)
+            self._remove_disk_file(key)
+
+    def _clear_locked(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.disk_dir:
+            for key in self._disk:
+                self._remove_disk_file(key)
+        self._disk.clear()
+        self._disk_bytes = 0
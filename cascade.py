@@ -0,0 +1,146 @@
+"""Cascade à deux étages : YOLO localise les poubelles, un classifieur léger juge leur remplissage.
+
+Toutes les découpes d'une image partent en un seul lot vers le classifieur
+Keras (MobileNetV2 ou CNN de `saved_models/`). Pour une caméra fixe dont les
+emplacements de poubelles sont connus (`config/cameras.json`), la passe YOLO
+est sautée : le coût ne dépend plus que du nombre de poubelles. Les découpes
+sont prises dans l'image source, et non dans l'image réduite à la taille
+d'inférence, qui laisserait moins de pixels qu'il n'en faut au classifieur.
+
+Le classifieur attendu est décrit par un fichier de métadonnées au même
+format que `saved_models/metadata.json` :
+    {"class_names": ["vide", "pleine"], "img_size": [224, 224], "preprocessing": "mobilenet_v2",
+     "full_classes": ["pleine"]}
+`full_classes` désigne les classes comptées comme pleines dans l'historique
+(par défaut, la dernière de `class_names`).
+"""
+import json
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+FILL_MODEL_PATH = "saved_models/fill_level.h5"
+FILL_METADATA_PATH = "saved_models/fill_level.json"
+CAMERAS_CONFIG = "config/cameras.json"
+
+
+class FillLevelClassifier:
+    """Classifieur Keras de niveau de remplissage, appelé par lots"""
+
+    def __init__(self, model_path=FILL_MODEL_PATH, metadata_path=FILL_METADATA_PATH):
+        import tensorflow as tf
+
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        self.class_names = metadata["class_names"]
+        self.full_classes = metadata.get("full_classes", self.class_names[-1:])
+        self.img_size = tuple(metadata.get("img_size", (224, 224)))
+        self.preprocessing = metadata.get("preprocessing", "rescale")
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+    def _preprocess(self, batch):
+        batch = batch.astype(np.float32)
+        if self.preprocessing == "mobilenet_v2":
+            return batch / 127.5 - 1.0
+        return batch / 255.0
+
+    def classify(self, crops_rgb):
+        """(classe, confiance) pour chaque découpe RGB, en une seule passe du modèle"""
+        if not crops_rgb:
+            return []
+        import cv2
+
+        batch = np.stack([cv2.resize(crop, self.img_size, interpolation=cv2.INTER_AREA) for crop in crops_rgb])
+        probs = self.model.predict(self._preprocess(batch), verbose=0)
+        best = probs.argmax(axis=1)
+        return [(self.class_names[i], float(p[i])) for i, p in zip(best, probs)]
+
+
+def full_classes(metadata_path=FILL_METADATA_PATH):
+    """Classes « pleine » du classifieur de remplissage, lues dans ses métadonnées (sans charger Keras)"""
+    try:
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return metadata.get("full_classes", metadata.get("class_names", [])[-1:])
+
+
+def _warn(message):
+    print(f"⚠️ {message}", flush=True)
+
+
+def load_classifier(model_path=FILL_MODEL_PATH, metadata_path=FILL_METADATA_PATH, on_error=_warn):
+    """Classifieur de remplissage, ou None s'il n'est pas installé ou ne se charge pas (signalé par `on_error`)"""
+    if not (os.path.exists(model_path) and os.path.exists(metadata_path)):
+        return None
+    try:
+        return FillLevelClassifier(model_path, metadata_path)
+    except ImportError:
+        return None
+    except Exception as e:
+        # Poids corrompus, métadonnées invalides, version de Keras incompatible...
+        on_error(f"Classifieur de remplissage inutilisable ({model_path}), niveau de remplissage désactivé : {e}")
+        return None
+
+
+def decode_for_crops(source, detections, img_size):
+    """Image source RGB et son échelle, décodée juste assez grande pour les découpes du classifieur.
+
+    Les JPEG sont décodés en mode `draft` à la plus petite échelle où la plus
+    petite boîte atteint encore `img_size` ; sinon en pleine résolution.
+    """
+    image = Image.open(source)
+    original_size = image.size
+    smallest = min(max(d["box"][2] - d["box"][0], d["box"][3] - d["box"][1]) for d in detections)
+    ratio = min(1.0, max(img_size) / max(smallest, 1.0))
+    if image.format == "JPEG" and ratio < 1:
+        image.draft("RGB", (math.ceil(original_size[0] * ratio), math.ceil(original_size[1] * ratio)))
+    image = image.convert("RGB")
+    return np.asarray(image), image.size[0] / original_size[0]
+
+
+def crop_boxes(image, boxes, scale=1.0, margin=0.05):
+    """Découpes (vues) des boîtes, élargies d'une marge, dans une image éventuellement réduite de `scale`"""
+    height, width = image.shape[:2]
+    crops = []
+    for x1, y1, x2, y2 in boxes:
+        dx, dy = (x2 - x1) * margin, (y2 - y1) * margin
+        left = max(int((x1 - dx) * scale), 0)
+        top = max(int((y1 - dy) * scale), 0)
+        right = min(int(np.ceil((x2 + dx) * scale)), width)
+        bottom = min(int(np.ceil((y2 + dy) * scale)), height)
+        if right > left and bottom > top:
+            crops.append(image[top:bottom, left:right])
+        else:
+            crops.append(np.zeros((1, 1, 3), dtype=image.dtype))
+    return crops
+
+
+def classify_detections(classifier, image, detections, scale=1.0, bgr=False):
+    """Ajoute `fill_level` et `fill_confidence` à chaque détection, découpée dans `image` (voir `decode_for_crops`)"""
+    crops = crop_boxes(image, [d["box"] for d in detections], scale)
+    if bgr:
+        crops = [np.ascontiguousarray(crop[:, :, ::-1]) for crop in crops]
+    for det, (label, conf) in zip(detections, classifier.classify(crops)):
+        det["fill_level"] = label
+        det["fill_confidence"] = conf
+    return detections
+
+
+def load_camera_bins(path=CAMERAS_CONFIG):
+    """Emplacements connus des poubelles par caméra : {camera: [[x1, y1, x2, y2], ...]}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cameras = json.load(f)
+    return {camera: conf["bins"] for camera, conf in cameras.items() if conf.get("bins")}
+
+
+def bin_detections(bins):
+    """Détections fictives couvrant les emplacements connus d'une caméra fixe"""
+    return [{"class_id": None, "class_name": "roi", "confidence": 1.0, "box": list(map(float, b))}
+            for b in bins]
+
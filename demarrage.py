@@ -0,0 +1,57 @@
+"""Démarrage à froid de l'application en arrière-plan.
+
+OpenCV, Ultralytics (donc PyTorch) et le modèle par défaut sont chargés dans un
+thread pendant que Streamlit affiche déjà l'interface. Une inférence de
+préchauffage sur une image noire 640x640 absorbe le coût de la première
+prédiction (graphe, allocateur) avant que le bouton d'analyse ne soit activé.
+Les durées de chaque étape sont conservées pour être affichées et exportées.
+"""
+import importlib
+import threading
+import time
+
+import detection
+from instrumentation import METRICS, Timings
+
+
+class Startup(threading.Thread):
+    """Imports lourds, chargement et préchauffage du modèle par défaut"""
+
+    def __init__(self, registry, model_name=None):
+        super().__init__(name="startup", daemon=True)
+        self.registry = registry
+        self.model_name = model_name
+        self.timings = Timings()
+        self.available = {}
+        self.errors = {}
+        self.ready = threading.Event()
+
+    def _import(self, module):
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            self.available[module] = True
+        except ImportError as e:
+            self.available[module] = False
+            self.errors[module] = str(e)
+        self.timings.record(f"import_{module}", (time.perf_counter() - start) * 1000)
+
+    def run(self):
+        try:
+            self._import("cv2")
+            self._import("ultralytics")
+            if self.available["ultralytics"] and self.model_name:
+                with self.timings.stage("chargement_modele"):
+                    model = self.registry.get(self.model_name)
+                if model is not None:
+                    with self.timings.stage("premiere_inference"):
+                        detection.warmup(model)
+        except Exception as e:
+            self.errors["modele"] = str(e)
+        finally:
+            METRICS.observe(self.timings)
+            print(f"🚀 Démarrage : {self.summary()}", flush=True)
+            self.ready.set()
+
+    def summary(self):
+        return " • ".join(f"{name} {ms / 1000:.1f} s" for name, ms in self.timings.stages.items())
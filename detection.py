@@ -0,0 +1,119 @@
+"""Chargement du modèle YOLO, prédiction et extraction des détections.
+
+Module sans dépendance à Streamlit : il est partagé par l'application
+(`poubelle.py`) et par le service d'inférence (`serveur_inference.py`).
+"""
+import os
+
+import numpy as np
+
+MODEL_PATH = "models/best.pt"
+# Seuil de confiance réglable sans redéploiement (voir evaluation.py --sweep-conf)
+DEFAULT_CONF = float(os.environ.get("POUBELLE_CONF", "0.25"))
+DEFAULT_IMGSZ = 640
+
+BACKENDS = ("pytorch", "onnx", "openvino", "int8")
+BACKEND_LABELS = {
+    "pytorch": "PyTorch",
+    "onnx": "ONNX Runtime",
+    "openvino": "OpenVINO",
+    "int8": "OpenVINO INT8",
+}
+
+
+def default_backend():
+    """Backend demandé par la configuration (variable POUBELLE_BACKEND)"""
+    backend = os.environ.get("POUBELLE_BACKEND", "pytorch").lower()
+    return backend if backend in BACKENDS else "pytorch"
+
+
+def backend_path(path, backend):
+    """Chemin des poids exportés pour un backend, à côté du fichier .pt"""
+    stem, _ = os.path.splitext(path)
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    if backend == "int8":
+        return stem + "_int8_openvino_model"
+    return path
+
+
+def load_model_with_backend(path=MODEL_PATH, backend=None):
+    """Charge le modèle sur le backend demandé, avec repli sur PyTorch.
+
+    Retourne (modèle, backend effectif), ou (None, None) si aucun fichier n'est disponible.
+    """
+    from ultralytics import YOLO
+
+    backend = backend or default_backend()
+    if backend != "pytorch":
+        exported = backend_path(path, backend)
+        if os.path.exists(exported):
+            try:
+                model = YOLO(exported, task="detect")
+                # Le backend exporté n'est réellement initialisé qu'à la première prédiction
+                warmup(model)
+                return model, backend
+            except Exception:
+                pass
+    if not os.path.exists(path):
+        return None, None
+    return YOLO(path), "pytorch"
+
+
+def load_model(path=MODEL_PATH, backend=None):
+    """Charge le modèle YOLO, ou retourne None si le fichier est absent"""
+    return load_model_with_backend(path, backend)[0]
+
+
+def warmup(model, imgsz=DEFAULT_IMGSZ):
+    """Prédiction sur une image noire : initialise le graphe et les allocations avant la première vraie analyse"""
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+
+
+def predict(model, images, conf=DEFAULT_CONF, imgsz=DEFAULT_IMGSZ):
+    """Lance une passe du modèle sur une image ou une liste d'images"""
+    return model.predict(images, conf=conf, imgsz=imgsz, verbose=False)
+
+
+def xywh_to_xyxy(boxes):
+    """Boîtes (xc, yc, w, h) -> (x1, y1, x2, y2), dans la même unité"""
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:4] / 2, boxes[:, :2] + boxes[:, 2:4] / 2], axis=1)
+
+
+def box_iou(a, b, metric="iou"):
+    """Matrice de recouvrement (N, M) entre deux ensembles de boîtes xyxy.
+
+    'iou' : intersection / union ; 'ios' : intersection / plus petite des deux boîtes.
+    """
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)[:, None]
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)[None, :]
+    if metric == "ios":
+        return inter / np.maximum(np.minimum(area_a, area_b), 1e-9)
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def class_name(model, cls_idx):
+    """Nom lisible d'une classe du modèle"""
+    return model.names[cls_idx] if hasattr(model, "names") else str(cls_idx)
+
+
+def extract_detections(model, r):
+    """Convertit les boîtes d'un résultat YOLO en liste de dictionnaires"""
+    dets = getattr(r, "boxes", None)
+    if not dets or len(dets) == 0:
+        return []
+    detections = []
+    for box in dets:
+        cls_idx = int(box.cls[0])
+        detections.append({
+            "class_id": cls_idx,
+            "class_name": class_name(model, cls_idx),
+            "confidence": float(box.conf[0]),
+            "box": [float(v) for v in box.xyxy[0].tolist()],
+        })
+    return detections
@@ -0,0 +1,163 @@
+"""Distillation d'un grand YOLOv8 vers un petit, puis publication dans `models/`.
+
+1. Enseignant : un YOLOv8 s/m entraîné sur le jeu de `train_yolo.py` (il est
+   entraîné d'abord si `--teacher` n'est pas fourni).
+2. Distillation par pseudo-étiquettes : l'enseignant annote les images
+   d'entraînement. Ses boîtes qui ne recouvrent aucune vérité terrain sont
+   ajoutées aux étiquettes, et les images de `--unlabeled` sont entièrement
+   étiquetées par lui. L'élève (nano par défaut) s'entraîne sur ce jeu enrichi.
+3. Publication : `models/<nom>.pt` et `models/<nom>.json`, qui contient le mAP
+   de validation et la latence CPU p50 mesurée par le chemin de prédiction de
+   l'application. Le gain de latence vient de la taille de l'élève : pas
+   d'élagage, car mettre des canaux à zéro sans les retirer du graphe coûte de
+   la précision sans rien accélérer.
+
+Utilisation :
+    python distillation.py --teacher-arch yolov8m.pt --student yolov8n.pt --name distill_n
+    python distillation.py --teacher runs/detect/teacher_m/weights/best.pt --student yolov8n.pt --name distill_n
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+import detection
+from donnees import list_images, list_split, measure_latency, read_labels
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+DISTILL_DIR = "runs/distill"
+RUNS_DIR = "runs/detect"
+
+
+def train_teacher(arch, data, epochs, imgsz, batch):
+    """Entraîne (ou réutilise) un enseignant de l'architecture donnée sur le jeu de données"""
+    name = "teacher_" + os.path.splitext(os.path.basename(arch))[0]
+    weights = os.path.join(RUNS_DIR, name, "weights", "best.pt")
+    if os.path.exists(weights):
+        print(f"♻️ Enseignant déjà entraîné : {weights}")
+        return weights
+    YOLO(arch).train(data=data, epochs=epochs, imgsz=imgsz, batch=batch, name=name, exist_ok=True, pretrained=True)
+    return weights
+
+
+def merge_labels(truth, teacher, iou_threshold=0.5):
+    """Vérité terrain + boîtes de l'enseignant qui ne recouvrent aucune boîte existante"""
+    if len(truth) and len(teacher):
+        # Boîtes normalisées : l'IoU ne dépend pas de la normalisation par axe
+        iou = detection.box_iou(detection.xywh_to_xyxy(teacher[:, 1:]), detection.xywh_to_xyxy(truth[:, 1:]))
+        teacher = teacher[iou.max(axis=1) < iou_threshold]
+    return np.concatenate([truth, teacher])
+
+
+def build_distilled_dataset(teacher_path, data, work_dir, unlabeled=None, conf=0.5, imgsz=640, batch=16):
+    """Jeu d'entraînement étiqueté par l'enseignant ; validation inchangée"""
+    from ultralytics.data.utils import check_det_dataset, img2label_paths
+
+    base = check_det_dataset(data)
+    teacher = YOLO(teacher_path)
+    labeled = list_split(base["train"])
+    images = [(path, label) for path, label in zip(labeled, img2label_paths(labeled))]
+    images += [(path, None) for path in (list_images(unlabeled) if unlabeled else [])]
+
+    images_dir = os.path.join(work_dir, "images")
+    labels_dir = os.path.join(work_dir, "labels")
+    for folder in (images_dir, labels_dir):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    added = 0
+    for start in range(0, len(images), batch):
+        chunk = images[start:start + batch]
+        results = teacher.predict([path for path, _ in chunk], conf=conf, imgsz=imgsz, verbose=False)
+        for index, ((path, label_path), r) in enumerate(zip(chunk, results), start=start):
+            boxes = r.boxes
+            predicted = np.concatenate([boxes.cls.cpu().numpy()[:, None], boxes.xywhn.cpu().numpy()], axis=1)
+            truth = read_labels(label_path) if label_path else np.zeros((0, 5), dtype=np.float32)
+            merged = merge_labels(truth, predicted.astype(np.float32))
+            added += len(merged) - len(truth)
+            # Préfixe d'index : deux splits peuvent contenir le même nom de fichier
+            stem = f"{index:06d}_{os.path.splitext(os.path.basename(path))[0]}"
+            os.symlink(os.path.abspath(path), os.path.join(images_dir, stem + os.path.splitext(path)[1]))
+            np.savetxt(os.path.join(labels_dir, stem + ".txt"), merged, fmt=["%d"] + ["%.6f"] * 4)
+
+    data_yaml = os.path.join(work_dir, "data.yaml")
+    with open(data_yaml, "w") as f:
+        yaml.safe_dump({
+            "train": os.path.abspath(images_dir),
+            "val": base["val"],
+            "nc": base["nc"],
+            "names": base["names"],
+        }, f, allow_unicode=True)
+    print(f"🧑‍🏫 {len(images)} images étiquetées par l'enseignant • {added} boîtes ajoutées")
+    return data_yaml
+
+
+def evaluate(weights, data, imgsz, latency_images, threads):
+    metrics = YOLO(weights).val(data=data, split="val", imgsz=imgsz, batch=1, device="cpu", plots=False)
+    return {
+        "map50": round(float(metrics.box.map50), 4),
+        "map50_95": round(float(metrics.box.map), 4),
+        "latency_p50_ms": round(measure_latency(weights, latency_images, imgsz, threads), 2),
+    }
+
+
+def publish(weights, name, metadata, models_dir=os.path.dirname(detection.MODEL_PATH)):
+    """Copie les poids à côté de best.pt avec leurs mesures (models/<nom>.json)"""
+    target = os.path.join(models_dir, name + ".pt")
+    shutil.copy2(weights, target)
+    with open(os.path.join(models_dir, name + ".json"), "w") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    print(f"✅ Publié : {target}")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distillation et publication d'un petit détecteur")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--teacher", default=None, help="Poids d'un enseignant déjà entraîné sur le jeu")
+    parser.add_argument("--teacher-arch", default="yolov8m.pt", help="Architecture entraînée si --teacher est absent")
+    parser.add_argument("--teacher-epochs", type=int, default=50)
+    parser.add_argument("--teacher-conf", type=float, default=0.5, help="Confiance minimale des pseudo-étiquettes")
+    parser.add_argument("--unlabeled", default=None, help="Dossier d'images non annotées à étiqueter par l'enseignant")
+    parser.add_argument("--student", default="yolov8n.pt")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Threads CPU pour la mesure de latence")
+    parser.add_argument("--latency-images", type=int, default=20)
+    parser.add_argument("--name", default="distill_n")
+    args = parser.parse_args()
+
+    from ultralytics.data.utils import check_det_dataset
+
+    teacher = args.teacher or train_teacher(args.teacher_arch, args.data, args.teacher_epochs, args.imgsz, args.batch)
+    work_dir = os.path.join(DISTILL_DIR, args.name)
+    data_yaml = build_distilled_dataset(teacher, args.data, work_dir, args.unlabeled,
+                                        args.teacher_conf, args.imgsz)
+
+    YOLO(args.student).train(data=data_yaml, epochs=args.epochs, imgsz=args.imgsz, batch=args.batch,
+                             name=args.name, exist_ok=True, pretrained=True)
+    weights = os.path.join(RUNS_DIR, args.name, "weights", "best.pt")
+
+    latency_images = list_split(check_det_dataset(args.data)["val"])[:args.latency_images]
+    rows = {"enseignant": evaluate(teacher, args.data, args.imgsz, latency_images, args.threads),
+            "élève": evaluate(weights, args.data, args.imgsz, latency_images, args.threads)}
+    for label, row in rows.items():
+        print(f"📊 {label:<10} mAP50 {row['map50']:.4f} • mAP50-95 {row['map50_95']:.4f} • "
+              f"latence p50 {row['latency_p50_ms']:.1f} ms")
+
+    publish(weights, args.name, {
+        **rows["élève"],
+        "teacher": teacher,
+        "student": args.student,
+        "imgsz": args.imgsz,
+        "threads": args.threads,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Jeu de données YOLO, étiquettes et mesure de latence partagés par les scripts.
+
+Module sans dépendance à Ultralytics à l'import : l'entraînement incrémental,
+la recherche d'hyperparamètres, la distillation, l'évaluation et les fragments
+en importent leurs utilitaires communs, sans que l'un dépende de la ligne de
+commande d'un autre.
+"""
+import os
+import time
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def list_images(images_dir):
+    return sorted(
+        os.path.abspath(os.path.join(root, f))
+        for root, _, files in os.walk(images_dir) for f in files
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def list_split(split):
+    """Images d'un split Ultralytics (dossier, fichier .txt ou liste)"""
+    images = []
+    for entry in split if isinstance(split, list) else [split]:
+        if str(entry).endswith(".txt"):
+            with open(entry) as f:
+                images.extend(line.strip() for line in f if line.strip())
+        else:
+            images.extend(list_images(entry))
+    return images
+
+
+def label_path(image_path):
+    """Fichier d'étiquettes YOLO d'une image (…/images/x.jpg -> …/labels/x.txt)"""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return os.path.splitext(sb.join(image_path.rsplit(sa, 1)))[0] + ".txt"
+
+
+def read_labels(path):
+    """Lignes YOLO (classe, xc, yc, w, h normalisés) d'un fichier d'étiquettes"""
+    if not os.path.exists(path):
+        return np.zeros((0, 5), dtype=np.float32)
+    labels = np.loadtxt(path, ndmin=2, dtype=np.float32)
+    return labels[:, :5] if labels.size else np.zeros((0, 5), dtype=np.float32)
+
+
+def limit_threads(threads):
+    """Nombre fixe de threads de calcul pour le processus courant"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+
+
+def measure_latency(weights, images, imgsz, threads, repeats=3):
+    """Latence p50 (ms) du chemin de prédiction de l'application pour un jeu de poids"""
+    limit_threads(threads)
+    import detection
+    from pretraitement import prepare
+
+    model = detection.load_model(weights, backend="pytorch")
+    latencies = []
+    for path in images * repeats:
+        start = time.perf_counter()
+        detection.predict(model, prepare(path, imgsz).array, imgsz=imgsz)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(latencies[len(images):] or latencies, 50))
@@ -0,0 +1,279 @@
+"""Évaluation rapide de jeux de poids sur le split de validation.
+
+Les prédictions brutes (confiance ≥ 0.001) de chaque image sont calculées une
+seule fois par modèle, par le même chemin que l'application (`prepare` puis
+`detection.predict`), et mises en cache sous l'empreinte des poids
+(`runs/eval/<empreinte>/`). Les paires prédiction / vérité terrain qui se
+recouvrent sont calculées une fois, par IoU vectorisée. Précision, rappel,
+mAP et matrice de confusion se recalculent ensuite en quelques millisecondes
+pour n'importe quel seuil de confiance ou d'IoU : de quoi régler
+`POUBELLE_CONF` sur des données plutôt qu'à l'estime.
+
+Utilisation :
+    python evaluation.py models/best.pt models/distill_n.pt --conf 0.25 --iou 0.5
+    python evaluation.py models/best.pt --sweep-conf
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+import detection
+from cache_resultats import file_hash
+from donnees import label_path, list_split, read_labels
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+EVAL_DIR = "runs/eval"
+RAW_CONF = 0.001
+MIN_PAIR_IOU = 0.1
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def load_ground_truth(images, sizes):
+    """Boîtes de vérité terrain en pixels : (indice d'image, boîtes xyxy, classes)"""
+    image_index, boxes, classes = [], [], []
+    for i, (path, (width, height)) in enumerate(zip(images, sizes)):
+        labels = read_labels(label_path(path))
+        if not len(labels):
+            continue
+        boxes.append(detection.xywh_to_xyxy(labels[:, 1:] * np.array([width, height, width, height], dtype=np.float32)))
+        classes.append(labels[:, 0].astype(int))
+        image_index.append(np.full(len(labels), i))
+    if not boxes:
+        return np.zeros(0, dtype=int), np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=int)
+    return np.concatenate(image_index), np.concatenate(boxes), np.concatenate(classes)
+
+
+def raw_predictions(weights, images, imgsz):
+    """Prédictions brutes du modèle, lues dans le cache ou calculées puis enregistrées"""
+    cache_dir = os.path.join(EVAL_DIR, file_hash(weights)[:16])
+    cache_path = os.path.join(cache_dir, f"predictions_{imgsz}.npz")
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path, allow_pickle=False)
+        if list(cached["images"]) == images:
+            return cache_dir, {key: cached[key] for key in cached.files}
+
+    from pretraitement import map_boxes, prepare
+
+    model = detection.load_model(weights, backend="pytorch")
+    image_index, boxes, scores, classes, sizes = [], [], [], [], []
+    for i, path in enumerate(images):
+        prepared = prepare(path, imgsz)
+        r = detection.predict(model, prepared.array, conf=RAW_CONF, imgsz=imgsz)[0]
+        dets = map_boxes(detection.extract_detections(model, r), prepared)
+        sizes.append(prepared.original_size)
+        image_index.extend([i] * len(dets))
+        boxes.extend(d["box"] for d in dets)
+        scores.extend(d["confidence"] for d in dets)
+        classes.extend(d["class_id"] for d in dets)
+        print(f"🔍 {i + 1}/{len(images)} images", end="\r", flush=True)
+    print()
+
+    predictions = {
+        "images": np.array(images),
+        "sizes": np.array(sizes, dtype=np.int32).reshape(-1, 2),
+        "image_index": np.array(image_index, dtype=int),
+        "boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        "scores": np.array(scores, dtype=np.float32),
+        "classes": np.array(classes, dtype=int),
+        "names": np.array([detection.class_name(model, c) for c in sorted(model.names)]),
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez_compressed(cache_path, **predictions)
+    return cache_dir, predictions
+
+
+class Evaluation:
+    """Prédictions, vérité terrain et paires qui se recouvrent, pour des recalculs instantanés"""
+
+    def __init__(self, predictions):
+        self.names = list(predictions["names"])
+        self.pred_image = predictions["image_index"]
+        self.pred_boxes = predictions["boxes"]
+        self.scores = predictions["scores"]
+        self.pred_classes = predictions["classes"]
+        images = list(predictions["images"])
+        self.gt_image, self.gt_boxes, self.gt_classes = load_ground_truth(images, predictions["sizes"])
+        self.pairs = self._pairs(len(images))
+        self._tp = None
+
+    def _pairs(self, n_images):
+        """Paires (prédiction, vérité) d'une même image avec IoU ≥ MIN_PAIR_IOU ; calculées une fois"""
+        pred_bounds = np.searchsorted(self.pred_image, np.arange(n_images + 1))
+        gt_bounds = np.searchsorted(self.gt_image, np.arange(n_images + 1))
+        p_idx, g_idx, ious = [], [], []
+        for i in range(n_images):
+            p0, p1, g0, g1 = pred_bounds[i], pred_bounds[i + 1], gt_bounds[i], gt_bounds[i + 1]
+            if p0 == p1 or g0 == g1:
+                continue
+            iou = detection.box_iou(self.pred_boxes[p0:p1], self.gt_boxes[g0:g1])
+            p, g = np.nonzero(iou >= MIN_PAIR_IOU)
+            p_idx.append(p + p0)
+            g_idx.append(g + g0)
+            ious.append(iou[p, g])
+        if not p_idx:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+        return np.concatenate(p_idx), np.concatenate(g_idx), np.concatenate(ious)
+
+    def match(self, conf, iou, same_class=True):
+        """Appariement glouton un-pour-un (IoU décroissante) ; retourne (prédictions, vérités) appariées"""
+        p, g, overlap = self.pairs
+        ok = (self.scores[p] >= conf) & (overlap >= iou)
+        if same_class:
+            ok &= self.pred_classes[p] == self.gt_classes[g]
+        p, g, overlap = p[ok], g[ok], overlap[ok]
+        for key in ("p", "g"):
+            # np.unique garde la première occurrence : on retrie par IoU avant chaque passe
+            order = np.argsort(-overlap, kind="stable")
+            p, g, overlap = p[order], g[order], overlap[order]
+            _, first = np.unique(p if key == "p" else g, return_index=True)
+            p, g, overlap = p[first], g[first], overlap[first]
+        return p, g
+
+    def true_positives(self):
+        """Matrice (prédictions, seuils IoU 0.5:0.95) des vrais positifs, sans seuil de confiance"""
+        if self._tp is None:
+            self._tp = np.zeros((len(self.scores), len(IOU_THRESHOLDS)), dtype=bool)
+            for j, iou in enumerate(IOU_THRESHOLDS):
+                self._tp[self.match(0.0, iou)[0], j] = True
+        return self._tp
+
+    def average_precision(self):
+        """AP par classe et par seuil IoU (interpolation 101 points, comme COCO / Ultralytics)"""
+        order = np.argsort(-self.scores, kind="stable")
+        tp, classes = self.true_positives()[order], self.pred_classes[order]
+        ap = np.full((len(self.names), len(IOU_THRESHOLDS)), np.nan)
+        x = np.linspace(0, 1, 101)
+        for c in range(len(self.names)):
+            n_gt = int((self.gt_classes == c).sum())
+            if n_gt == 0:
+                continue
+            tpc = tp[classes == c]
+            ap[c] = 0.0
+            if not len(tpc):
+                continue
+            tp_cum = np.cumsum(tpc, axis=0)
+            fp_cum = np.cumsum(~tpc, axis=0)
+            recall = np.vstack([np.zeros((1, tpc.shape[1])), tp_cum / n_gt, np.ones((1, tpc.shape[1]))])
+            precision = np.vstack([np.ones((1, tpc.shape[1])), tp_cum / (tp_cum + fp_cum),
+                                   np.zeros((1, tpc.shape[1]))])
+            # Enveloppe décroissante de la précision
+            precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+            for j in range(tpc.shape[1]):
+                y = np.interp(x, recall[:, j], precision[:, j])
+                ap[c, j] = float(((y[1:] + y[:-1]) / 2 * np.diff(x)).sum())
+        return ap
+
+    def precision_recall(self, conf, iou):
+        """Précision et rappel par classe aux seuils donnés : (tp, prédictions, vérités) par classe"""
+        nc = len(self.names)
+        p, _ = self.match(conf, iou)
+        tp = np.bincount(self.pred_classes[p], minlength=nc)
+        n_pred = np.bincount(self.pred_classes[self.scores >= conf], minlength=nc)
+        n_gt = np.bincount(self.gt_classes, minlength=nc)
+        return tp, n_pred, n_gt
+
+    def confusion_matrix(self, conf, iou):
+        """Matrice [prédite, réelle] avec une ligne / colonne « fond » pour les fausses détections et les oublis"""
+        nc = len(self.names)
+        matrix = np.zeros((nc + 1, nc + 1), dtype=int)
+        p, g = self.match(conf, iou, same_class=False)
+        np.add.at(matrix, (self.pred_classes[p], self.gt_classes[g]), 1)
+        unmatched_pred = np.ones(len(self.scores), dtype=bool)
+        unmatched_pred[p] = False
+        unmatched_pred &= self.scores >= conf
+        np.add.at(matrix, (self.pred_classes[unmatched_pred], nc), 1)
+        unmatched_gt = np.ones(len(self.gt_classes), dtype=bool)
+        unmatched_gt[g] = False
+        np.add.at(matrix, (nc, self.gt_classes[unmatched_gt]), 1)
+        return matrix
+
+    def summary(self, conf, iou):
+        tp, n_pred, n_gt = self.precision_recall(conf, iou)
+        precision = tp.sum() / max(n_pred.sum(), 1)
+        recall = tp.sum() / max(n_gt.sum(), 1)
+        ap = self.average_precision()
+        return {
+            "precision": round(float(precision), 4),
+            "recall": round(float(recall), 4),
+            "f1": round(float(2 * precision * recall / max(precision + recall, 1e-9)), 4),
+            "map50": round(float(np.nanmean(ap[:, 0])), 4) if np.isfinite(ap).any() else 0.0,
+            "map50_95": round(float(np.nanmean(ap)), 4) if np.isfinite(ap).any() else 0.0,
+        }
+
+
+def print_report(evaluation, conf, iou):
+    tp, n_pred, n_gt = evaluation.precision_recall(conf, iou)
+    ap = evaluation.average_precision()
+    print(f"{'classe':<20}{'vérités':>9}{'P':>8}{'R':>8}{'AP50':>8}{'AP50-95':>9}")
+    for c, name in enumerate(evaluation.names):
+        if not n_gt[c] and not n_pred[c]:
+            continue
+        p = tp[c] / n_pred[c] if n_pred[c] else 0.0
+        r = tp[c] / n_gt[c] if n_gt[c] else 0.0
+        print(f"{name:<20}{n_gt[c]:>9}{p:>8.3f}{r:>8.3f}{np.nan_to_num(ap[c, 0]):>8.3f}"
+              f"{np.nan_to_num(np.nanmean(ap[c]) if np.isfinite(ap[c]).any() else 0):>9.3f}")
+
+
+def write_confusion(path, evaluation, matrix):
+    labels = evaluation.names + ["fond"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["prédit \\ réel"] + labels)
+        for label, row in zip(labels, matrix):
+            writer.writerow([label] + row.tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évaluation avec cache des prédictions et recalcul instantané")
+    parser.add_argument("weights", nargs="+", help="Un ou plusieurs jeux de poids à comparer")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--imgsz", type=int, default=detection.DEFAULT_IMGSZ)
+    parser.add_argument("--conf", type=float, default=detection.DEFAULT_CONF)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU minimale d'un vrai positif")
+    parser.add_argument("--sweep-conf", action="store_true", help="Balaye le seuil de confiance (meilleur F1)")
+    args = parser.parse_args()
+
+    from ultralytics.data.utils import check_det_dataset
+
+    images = list_split(check_det_dataset(args.data)[args.split])
+    rows = []
+    for weights in args.weights:
+        cache_dir, predictions = raw_predictions(weights, images, args.imgsz)
+        evaluation = Evaluation(predictions)
+        start = time.perf_counter()
+        summary = evaluation.summary(args.conf, args.iou)
+        matrix = evaluation.confusion_matrix(args.conf, args.iou)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        print(f"\n📊 {weights} • conf {args.conf} • IoU {args.iou} • recalculé en {elapsed:.1f} ms")
+        print_report(evaluation, args.conf, args.iou)
+        write_confusion(os.path.join(cache_dir, "confusion.csv"), evaluation, matrix)
+        with open(os.path.join(cache_dir, "metrics.json"), "w") as f:
+            json.dump({"weights": weights, "conf": args.conf, "iou": args.iou, **summary}, f, indent=2)
+        print(f"🧮 Matrice de confusion : {os.path.join(cache_dir, 'confusion.csv')}")
+
+        if args.sweep_conf:
+            start = time.perf_counter()
+            sweep = [(conf, evaluation.summary(conf, args.iou)) for conf in np.arange(0.05, 0.96, 0.05)]
+            elapsed = (time.perf_counter() - start) * 1000
+            for conf, s in sweep:
+                print(f"   conf {conf:.2f} • P {s['precision']:.3f} • R {s['recall']:.3f} • F1 {s['f1']:.3f}")
+            best_conf, best = max(sweep, key=lambda item: item[1]["f1"])
+            print(f"🎯 Meilleur F1 {best['f1']:.3f} à conf {best_conf:.2f} ({len(sweep)} seuils en {elapsed:.0f} ms) "
+                  f"→ POUBELLE_CONF={best_conf:.2f}")
+        rows.append((weights, summary))
+
+    if len(rows) > 1:
+        print(f"\n{'poids':<40}{'P':>8}{'R':>8}{'F1':>8}{'mAP50':>8}{'mAP50-95':>10}")
+        for weights, s in rows:
+            print(f"{weights:<40}{s['precision']:>8.3f}{s['recall']:>8.3f}{s['f1']:>8.3f}"
+                  f"{s['map50']:>8.3f}{s['map50_95']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
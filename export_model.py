@@ -0,0 +1,41 @@
+"""Export des poids PyTorch vers ONNX et, en option, OpenVINO pour l'inférence CPU.
+
+Les fichiers sont écrits à côté des poids (`models/best.onnx`,
+`models/best_openvino_model/`), là où `detection.load_model` les cherche
+quand POUBELLE_BACKEND vaut `onnx` ou `openvino`.
+
+Utilisation :
+    python export_model.py
+    python export_model.py --openvino
+"""
+import argparse
+
+from ultralytics import YOLO
+
+import detection
+
+
+def export(weights, formats, imgsz=detection.DEFAULT_IMGSZ):
+    """Exporte les poids dans chacun des formats demandés et retourne les chemins produits"""
+    model = YOLO(weights)
+    outputs = {}
+    for fmt in formats:
+        # Axes dynamiques : l'inférence par lots et les autres tailles d'image restent possibles
+        outputs[fmt] = model.export(format=fmt, imgsz=imgsz, dynamic=True, simplify=True, device="cpu")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export du modèle vers les backends CPU")
+    parser.add_argument("--weights", default=detection.MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=detection.DEFAULT_IMGSZ)
+    parser.add_argument("--openvino", action="store_true", help="Exporte aussi au format OpenVINO")
+    args = parser.parse_args()
+
+    formats = ["onnx"] + (["openvino"] if args.openvino else [])
+    for fmt, path in export(args.weights, formats, args.imgsz).items():
+        print(f"✅ {detection.BACKEND_LABELS[fmt]} : {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Filtrage des images inchangées devant le détecteur (caméras fixes).
+
+Chaque image est réduite en une vignette 32x32 en niveaux de gris. Elle est
+comparée à la vignette de la dernière image réellement analysée, par écart
+moyen (`diff`) ou par hachage perceptuel (`phash`). Si la scène n'a pas changé
+au-delà du seuil, les dernières détections sont réutilisées. Une analyse
+complète est forcée après un intervalle maximal. Le taux d'images sautées
+permet de dimensionner le matériel sur le débit réel.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SIGNATURE_SIZE = 32
+
+
+def signature(frame):
+    """Vignette 32x32 en niveaux de gris (float 0..1) d'une image BGR ou RGB"""
+    try:
+        import cv2
+        small = cv2.resize(frame, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    except ImportError:
+        h, w = frame.shape[:2]
+        small = frame[::max(1, h // SIGNATURE_SIZE), ::max(1, w // SIGNATURE_SIZE)][:SIGNATURE_SIZE, :SIGNATURE_SIZE]
+    small = small.astype(np.float32)
+    gray = small.mean(axis=2) if small.ndim == 3 else small
+    return gray / 255.0
+
+
+def phash(gray):
+    """Hachage perceptuel 64 bits : signe des basses fréquences de la DCT par rapport à leur médiane"""
+    n = gray.shape[0]
+    k = np.arange(n)
+    basis = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    low = (basis @ gray @ basis.T)[:8, :8]
+    return (low > np.median(low)).ravel()
+
+
+class FrameGate:
+    """Décide si une image doit passer par le détecteur"""
+
+    def __init__(self, threshold=0.03, method="diff", max_interval=60.0):
+        self.threshold = threshold
+        self.method = method
+        self.max_interval = max_interval
+        self.frames = 0
+        self.inferences = 0
+        self._reference = None
+        self._last_inference = 0.0
+        self._last_detections = None
+        self._lock = threading.Lock()
+
+    def _distance(self, gray):
+        if self.method == "phash":
+            # Proportion de bits différents entre les deux hachages
+            return float(np.mean(phash(gray) != phash(self._reference)))
+        return float(np.mean(np.abs(gray - self._reference)))
+
+    def process(self, frame, infer):
+        """Détections de l'image : `infer(frame)` si la scène a changé, sinon les dernières connues.
+
+        Retourne (détections, réutilisées).
+        """
+        gray = signature(frame)
+        now = time.monotonic()
+        with self._lock:
+            self.frames += 1
+            reuse = (
+                self._reference is not None
+                and now - self._last_inference < self.max_interval
+                and self._distance(gray) <= self.threshold
+            )
+            if reuse:
+                return self._last_detections, True
+        detections = infer(frame)
+        with self._lock:
+            self.inferences += 1
+            self._reference = gray
+            self._last_inference = now
+            self._last_detections = detections
+        return detections, False
+
+    def skip_ratio(self):
+        return 1.0 - self.inferences / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {"frames": self.frames, "inferences": self.inferences, "skip_ratio": round(self.skip_ratio(), 4)}
+
+
+class CameraGates:
+    """Une porte par caméra, au plus `max_cameras` : la moins récemment vue est oubliée"""
+
+    def __init__(self, max_cameras=64, threshold=0.03, method="diff", max_interval=60.0):
+        self.max_cameras = max_cameras
+        self.threshold = threshold
+        self.method = method
+        self.max_interval = max_interval
+        self._gates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, camera):
+        with self._lock:
+            gate = self._gates.get(camera)
+            if gate is None:
+                gate = self._gates[camera] = FrameGate(self.threshold, self.method, self.max_interval)
+                # L'identifiant vient du client : sans borne, chaque valeur inventée garderait une porte en mémoire
+                while len(self._gates) > self.max_cameras:
+                    self._gates.popitem(last=False)
+            else:
+                self._gates.move_to_end(camera)
+            return gate
+
+    def __len__(self):
+        return len(self._gates)
+
+    def items(self):
+        with self._lock:
+            return list(self._gates.items())
@@ -0,0 +1,206 @@
+"""Historique des détections dans une base SQLite embarquée.
+
+Chaque détection est enregistrée avec son horodatage, sa source (caméra ou
+poubelle), sa classe, sa confiance, sa boîte et son niveau de remplissage. Les
+écritures sont regroupées par un thread dédié : une transaction par lot, et
+non une par détection. Dans la même transaction, les agrégats par heure et par
+jour sont mis à jour (UPSERT). Les vues d'historique lisent ces agrégats
+plutôt que la table brute, si bien qu'elles restent rapides quand la table
+atteint des millions de lignes. Les périodes suivent l'heure locale : un jour
+va de minuit à minuit dans le fuseau du serveur, changements d'heure compris.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+
+HISTORY_DB = "data/historique.db"
+PERIODS = ("hour", "day")
+# Version 1 : agrégats sur les heures et jours locaux (la version 0 découpait en UTC)
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    fill_level TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_detections_ts ON detections (ts);
+CREATE INDEX IF NOT EXISTS idx_detections_source_ts ON detections (source, ts);
+CREATE INDEX IF NOT EXISTS idx_detections_class_ts ON detections (class_name, ts);
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{period} (
+    bucket INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    fill_level TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (bucket, source, class_name, fill_level)
+) WITHOUT ROWID;
+"""
+
+UPSERT = """
+INSERT INTO rollup_{period} (bucket, source, class_name, fill_level, count, confidence_sum)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket, source, class_name, fill_level) DO UPDATE SET
+    count = count + excluded.count,
+    confidence_sum = confidence_sum + excluded.confidence_sum
+"""
+
+_STOP = object()
+
+
+def bucket_start(ts, period):
+    """Horodatage du début de l'heure ou du jour local qui contient `ts`"""
+    t = time.localtime(ts)
+    if period == "day":
+        return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1)))
+    # tm_isdst distingue les deux passages de l'heure répétée au retour à l'heure d'hiver
+    return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, 0, 0, 0, 0, t.tm_isdst)))
+
+
+def upsert_rollups(connection, rows):
+    """Ajoute des lignes (ts, source, classe, confiance, x1, y1, x2, y2, remplissage) aux agrégats"""
+    for period in PERIODS:
+        counts, sums = Counter(), Counter()
+        for ts, source, class_name, confidence, *_, fill_level in rows:
+            key = (bucket_start(ts, period), source, class_name, fill_level)
+            counts[key] += 1
+            sums[key] += confidence
+        connection.executemany(UPSERT.format(period=period),
+                               [(*key, counts[key], sums[key]) for key in counts])
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    # WAL : les lectures de l'application ne bloquent pas le thread d'écriture
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class HistoryStore:
+    """Enregistrement asynchrone des détections et lecture des agrégats"""
+
+    def __init__(self, path=HISTORY_DB, batch_size=500, flush_interval=1.0, max_queue=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(connect(path)) as connection:
+            connection.executescript(SCHEMA + "".join(ROLLUP_SCHEMA.format(period=p) for p in PERIODS))
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._rebuild_rollups(connection)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, source, detections, ts=None):
+        """Planifie l'enregistrement des détections d'une analyse (sans attendre l'écriture)"""
+        ts = time.time() if ts is None else ts
+        for det in detections:
+            x1, y1, x2, y2 = det["box"]
+            row = (ts, source or "", det["class_name"], det["confidence"], x1, y1, x2, y2, det.get("fill_level") or "")
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                # Base saturée : on perd la ligne plutôt que de ralentir l'analyse
+                self.dropped += 1
+
+    @staticmethod
+    def _rebuild_rollups(connection, chunk=10000):
+        """Recalcule les agrégats depuis la table brute (base créée par une version antérieure)"""
+        with connection:
+            for period in PERIODS:
+                connection.execute(f"DELETE FROM rollup_{period}")
+            cursor = connection.execute(
+                "SELECT ts, source, class_name, confidence, x1, y1, x2, y2, fill_level FROM detections")
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    break
+                upsert_rollups(connection, rows)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _run(self):
+        connection = connect(self.path)
+        stop = False
+        while not stop:
+            rows = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if rows:
+                self._write(connection, rows)
+        connection.close()
+
+    def _write(self, connection, rows):
+        with connection:
+            connection.executemany(
+                "INSERT INTO detections (ts, source, class_name, confidence, x1, y1, x2, y2, fill_level) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            upsert_rollups(connection, rows)
+
+    def close(self):
+        """Écrit les lignes en attente puis arrête le thread d'écriture"""
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def sources(self):
+        with closing(connect(self.path)) as connection:
+            return [row[0] for row in connection.execute("SELECT DISTINCT source FROM rollup_day ORDER BY source")]
+
+    def rollup(self, period="hour", since=None, source=None, full_classes=()):
+        """Agrégats par période : nombre d'objets, confiance moyenne et taux de remplissage.
+
+        `full_classes` sont les classes « pleine » du classifieur de remplissage
+        (voir `cascade.full_classes`).
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Période inconnue : {period}")
+        full_classes = list(full_classes)
+        full_test = f"fill_level IN ({', '.join('?' * len(full_classes))})" if full_classes else "0"
+        query = (f"SELECT bucket, SUM(count), SUM(confidence_sum), "
+                 f"SUM(CASE WHEN {full_test} THEN count ELSE 0 END), "
+                 f"SUM(CASE WHEN fill_level != '' THEN count ELSE 0 END) "
+                 f"FROM rollup_{period} WHERE bucket >= ?")
+        params = [*full_classes, since or 0]
+        if source:
+            query += " AND source = ?"
+            params.append(source)
+        query += " GROUP BY bucket ORDER BY bucket"
+        with closing(connect(self.path)) as connection:
+            rows = connection.execute(query, params).fetchall()
+        return [{
+            "période": bucket,
+            "objets": count,
+            "confiance moyenne": confidence_sum / count,
+            "taux de remplissage": full / classified if classified else None,
+        } for bucket, count, confidence_sum, full, classified in rows]
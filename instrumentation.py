@@ -0,0 +1,120 @@
+"""Chronométrage des étapes du chemin d'analyse et export au format Prometheus.
+
+Chaque analyse est découpée en étapes (décodage, prétraitement, inférence, NMS,
+annotation, rendu). Les durées alimentent un histogramme cumulatif par étape
+(compteurs qui ne font que croître, comme l'attend Prometheus), et les
+percentiles des N dernières mesures sont exportés à part comme jauges. L'export
+en texte Prometheus passe par la route
+`/metrics` du service d'inférence, ou dans le fichier POUBELLE_METRICS_FILE
+(collecteur « textfile » de node_exporter).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+WINDOW = 1000
+METRIC_NAME = "poubelle_stage_duration_seconds"
+WINDOW_METRIC_NAME = "poubelle_stage_duration_window_seconds"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Timings:
+    """Durées (ms) des étapes d'une analyse, dans l'ordre où elles ont été mesurées"""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def record_yolo(self, r):
+        """Reprend le découpage mesuré par Ultralytics : prétraitement, inférence, NMS"""
+        speed = getattr(r, "speed", None) or {}
+        for key, name in (("preprocess", "yolo_preprocess"), ("inference", "inference"), ("postprocess", "nms")):
+            if speed.get(key) is not None:
+                self.record(name, speed[key])
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def rows(self):
+        total = self.total() or 1.0
+        return [{"étape": name, "durée (ms)": round(ms, 2), "part": f"{ms / total:.0%}"}
+                for name, ms in self.stages.items()]
+
+
+class StageMetrics:
+    """Histogramme cumulatif et fenêtre glissante des durées par étape"""
+
+    def __init__(self, window=WINDOW, export_path=None, export_interval=10.0):
+        self.window = window
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self._samples = {}
+        # Par étape : [compte par seuil de BUCKETS_MS, compte total, somme en ms], depuis le démarrage
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._last_export = 0.0
+
+    def observe(self, timings):
+        with self._lock:
+            for name, ms in timings.stages.items():
+                self._samples.setdefault(name, deque(maxlen=self.window)).append(ms)
+                buckets, totals = self._totals.setdefault(name, ([0] * len(BUCKETS_MS), [0, 0.0]))
+                for i, bound in enumerate(BUCKETS_MS):
+                    if ms <= bound:
+                        buckets[i] += 1
+                totals[0] += 1
+                totals[1] += ms
+        if self.export_path and time.monotonic() - self._last_export >= self.export_interval:
+            self.write(self.export_path)
+
+    def prometheus_text(self):
+        """Histogramme cumulatif et percentiles glissants au format d'exposition texte de Prometheus"""
+        with self._lock:
+            totals = {name: (list(buckets), list(counts)) for name, (buckets, counts) in self._totals.items()}
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+        lines = [
+            f"# HELP {METRIC_NAME} Durée des étapes d'analyse depuis le démarrage",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for name, (buckets, (count, total_ms)) in sorted(totals.items()):
+            for bound, bucket_count in zip(BUCKETS_MS, buckets):
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound / 1000:g}"}} {bucket_count}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {total_ms / 1000:.6f}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {count}')
+        lines += [
+            f"# HELP {WINDOW_METRIC_NAME} Percentiles des {self.window} dernières durées de chaque étape",
+            f"# TYPE {WINDOW_METRIC_NAME} gauge",
+        ]
+        for name, values in sorted(samples.items()):
+            for q in QUANTILES:
+                value = values[min(len(values) - 1, int(q * len(values)))]
+                lines.append(f'{WINDOW_METRIC_NAME}{{stage="{name}",quantile="{q:g}"}} {value / 1000:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Écrit l'export de façon atomique (le collecteur ne lit jamais un fichier partiel)"""
+        with self._export_lock:
+            self._last_export = time.monotonic()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+
+
+METRICS = StageMetrics(export_path=os.environ.get("POUBELLE_METRICS_FILE") or None)
@@ -0,0 +1,113 @@
+"""Budget mémoire du processus de l'application.
+
+La mémoire résidente (RSS) est comparée à un plafond (`POUBELLE_MEMORY_MB`).
+Au-delà de 75 %, l'application passe en mode réduit : pas de décodage pleine
+résolution (mode tuilé), lots plus petits, cache mémoire des résultats réduit
+et sessions inactives libérées. Au-delà de 90 %, les nouvelles analyses sont
+refusées jusqu'à ce que la mémoire redescende. Seuls les fichiers importés par
+des sessions inactives depuis `POUBELLE_SESSION_IDLE_S` secondes sont libérés,
+quel que soit le niveau : une session active ne perd jamais ses imports.
+"""
+import gc
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+NORMAL, REDUCED, CRITICAL = "normal", "réduit", "critique"
+
+
+def rss_bytes():
+    """Mémoire résidente actuelle du processus (pic depuis le démarrage hors Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss est en Ko sous Linux, en octets sous macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def limit_display(array, max_side):
+    """Réduit une image (H, W, C) pour l'affichage si son plus grand côté dépasse `max_side`"""
+    height, width = array.shape[:2]
+    if max(height, width) <= max_side:
+        return array
+    ratio = max_side / max(height, width)
+    image = Image.fromarray(array).resize((max(1, round(width * ratio)), max(1, round(height * ratio))),
+                                          Image.BILINEAR)
+    return np.asarray(image)
+
+
+def release_session_files(session_id):
+    """Libère les fichiers importés d'une session Streamlit (API interne : ignorée si indisponible)"""
+    try:
+        from streamlit.runtime import Runtime
+        Runtime.instance().uploaded_file_mgr.remove_session_files(session_id)
+        return True
+    except Exception:
+        return False
+
+
+class SessionTracker:
+    """Dernière activité de chaque session, pour libérer celles qui sont inactives"""
+
+    def __init__(self, idle_seconds=900):
+        self.idle_seconds = idle_seconds
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id):
+        with self._lock:
+            self._last_seen[session_id] = time.monotonic()
+
+    def evict_idle(self, idle_seconds=None, keep=None):
+        """Libère les sessions inactives depuis `idle_seconds` ; retourne leur nombre"""
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        now = time.monotonic()
+        with self._lock:
+            idle = [sid for sid, seen in self._last_seen.items() if now - seen >= idle_seconds and sid != keep]
+            for sid in idle:
+                del self._last_seen[sid]
+        for sid in idle:
+            release_session_files(sid)
+        return len(idle)
+
+    def __len__(self):
+        return len(self._last_seen)
+
+
+class MemoryBudget:
+    """Plafond mémoire du processus et dégradation progressive"""
+
+    def __init__(self, limit_bytes=0, reduced_at=0.75, critical_at=0.9):
+        self.limit_bytes = limit_bytes
+        self.reduced_at = reduced_at
+        self.critical_at = critical_at
+        self.level = NORMAL
+
+    def usage(self):
+        rss = rss_bytes()
+        ratio = rss / self.limit_bytes if self.limit_bytes else 0.0
+        return {"rss_bytes": rss, "limit_bytes": self.limit_bytes, "ratio": ratio}
+
+    def check(self, result_cache=None, sessions=None, session_id=None):
+        """Niveau courant ; libère ce qui peut l'être quand le plafond approche"""
+        if sessions is not None:
+            sessions.evict_idle(keep=session_id)
+        ratio = self.usage()["ratio"]
+        level = CRITICAL if ratio >= self.critical_at else REDUCED if ratio >= self.reduced_at else NORMAL
+        if level != NORMAL:
+            if result_cache is not None:
+                result_cache.trim_memory(0 if level == CRITICAL else result_cache.max_memory_bytes // 4)
+            gc.collect()
+            ratio = self.usage()["ratio"]
+            level = CRITICAL if ratio >= self.critical_at else REDUCED if ratio >= self.reduced_at else NORMAL
+        if level != self.level:
+            print(f"🧠 Mémoire : {self.level} → {level} ({ratio:.0%} du plafond)", flush=True)
+            self.level = level
+        return level
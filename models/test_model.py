@@ -1,7 +1,240 @@
-from ultralytics import YOLO
+"""Test du modèle sur une image, ou traitement en masse d'un dossier d'archives.
 
-model = YOLO("models/best.pt")
+Sur une image, les détections sont affichées comme avant. Sur un dossier, les
+chemins sont parcourus par un générateur (ordre déterministe), décodés dans des
+processus workers, analysés par lots et écrits au fil de l'eau en JSONL ou en
+Parquet. Un fichier de progression permet de reprendre après une interruption
+sans retraiter les fichiers déjà faits. Il n'avance que sur des résultats
+durables : chaque ligne JSONL est synchronisée, et chaque fichier Parquet est
+fermé (donc lisible) avant d'être compté. Après un arrêt brutal, seules les
+lignes du fichier Parquet en cours sont refaites. La mémoire reste constante quelle que
+soit la taille du dossier : le nombre d'images décodées en vol est borné.
 
-results = model("models/101.webp")
+Utilisation :
+    python models/test_model.py models/101.webp
+    python models/test_model.py /archives/2024 --output detections.jsonl --batch 16 --workers 6
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-results[0].show()  # Affiche les detections
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detection  # noqa: E402
+from donnees import IMAGE_EXTENSIONS  # noqa: E402
+from pretraitement import map_boxes, prepare  # noqa: E402
+
+
+def path_key(path, root):
+    """Clé d'ordre du parcours : composants du chemin relatif"""
+    return tuple(os.path.relpath(path, root).split(os.sep))
+
+
+def iter_image_paths(root):
+    """Parcours en profondeur trié, sans jamais lister l'arborescence entière en mémoire"""
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_image_paths(entry.path)
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path
+
+
+def decode(path, imgsz):
+    """Décodage et letterbox dans un processus worker"""
+    try:
+        prepared = prepare(path, imgsz, out=np.empty((imgsz, imgsz, 3), dtype=np.uint8))
+        # L'image d'affichage n'est pas renvoyée au processus principal
+        return path, prepared._replace(display=None), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        """Écrit et synchronise les lignes ; retourne True (tout ce qui est écrit est durable)"""
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Fichiers part-XXXXX.parquet de `rows_per_part` lignes, un groupe de lignes par lot.
+
+    Un fichier Parquet n'est lisible qu'une fois son pied de page écrit par
+    `close()` : chaque part est écrite sous un nom temporaire, fermée, puis
+    renommée. `write` retourne True quand toutes les lignes reçues sont dans
+    des parts fermées.
+    """
+
+    def __init__(self, path, rows_per_part=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.rows_per_part = rows_per_part
+        os.makedirs(path, exist_ok=True)
+        self._part = len([f for f in os.listdir(path) if f.endswith(".parquet")])
+        self._schema = pa.schema([("path", pa.string()), ("width", pa.int32()), ("height", pa.int32()),
+                                  ("detections", pa.string()), ("error", pa.string())])
+        self._writer = None
+        self._rows = 0
+
+    def _part_path(self):
+        return os.path.join(self.path, f"part-{self._part:05d}.parquet")
+
+    def write(self, records):
+        rows = {name: [] for name in self._schema.names}
+        for record in records:
+            rows["path"].append(record["path"])
+            rows["width"].append(record.get("width"))
+            rows["height"].append(record.get("height"))
+            rows["detections"].append(json.dumps(record.get("detections", []), ensure_ascii=False))
+            rows["error"].append(record.get("error"))
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._part_path() + ".tmp", self._schema)
+        self._writer.write_table(self._pa.table(rows, schema=self._schema))
+        self._rows += len(records)
+        if self._rows >= self.rows_per_part:
+            self._close_part()
+            return True
+        return False
+
+    def _close_part(self):
+        self._writer.close()
+        os.replace(self._part_path() + ".tmp", self._part_path())
+        self._writer = None
+        self._rows = 0
+        self._part += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._close_part()
+
+
+def read_progress(progress_path):
+    if not os.path.exists(progress_path):
+        return None, 0
+    with open(progress_path, encoding="utf-8") as f:
+        progress = json.load(f)
+    return progress["last_path"], progress["count"]
+
+
+def write_progress(progress_path, last_path, count):
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"last_path": last_path, "count": count}, f, ensure_ascii=False)
+    os.replace(tmp_path, progress_path)
+
+
+def process_folder(model, executor, root, output, fmt, batch_size, imgsz, conf, prefetch, part_rows=10000):
+    progress_path = output + ".progress.json"
+    last_path, count = read_progress(progress_path)
+    last_key = path_key(last_path, root) if last_path else None
+    if last_path:
+        print(f"↪️ Reprise après {count} fichier(s) : {last_path}")
+
+    paths = (p for p in iter_image_paths(root) if last_key is None or path_key(p, root) > last_key)
+    writer = ParquetWriter(output, part_rows) if fmt == "parquet" else JsonlWriter(output)
+    in_flight = deque()
+    batch = []
+    written_path = None
+
+    def flush(batch):
+        nonlocal count, written_path
+        valid = [(path, prepared) for path, prepared, error in batch if prepared is not None]
+        results = detection.predict(model, [p.array for _, p in valid], conf=conf, imgsz=imgsz) if valid else []
+        detections = {path: map_boxes(detection.extract_detections(model, r), p)
+                      for (path, p), r in zip(valid, results)}
+        records = []
+        for path, prepared, error in batch:
+            if prepared is None:
+                records.append({"path": path, "error": error})
+            else:
+                width, height = prepared.original_size
+                records.append({"path": path, "width": width, "height": height, "detections": detections[path]})
+        count += len(batch)
+        written_path = batch[-1][0]
+        if writer.write(records):
+            # La progression n'avance que sur des lignes relisibles après un arrêt brutal
+            write_progress(progress_path, written_path, count)
+        print(f"🔍 {count} fichier(s) traités", end="\r", flush=True)
+
+    try:
+        for path in paths:
+            in_flight.append(executor.submit(decode, path, imgsz))
+            # Nombre borné d'images décodées en vol : mémoire constante
+            while len(in_flight) >= prefetch:
+                batch.append(in_flight.popleft().result())
+                if len(batch) == batch_size:
+                    flush(batch)
+                    batch = []
+        while in_flight:
+            batch.append(in_flight.popleft().result())
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        writer.close()
+        if written_path is not None:
+            write_progress(progress_path, written_path, count)
+    print(f"\n✅ {count} fichier(s) traités • résultats dans {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test du modèle ou traitement en masse d'un dossier")
+    parser.add_argument("source", nargs="?", default="models/101.webp", help="Image ou dossier")
+    parser.add_argument("--model", default=detection.MODEL_PATH)
+    parser.add_argument("--output", default="detections.jsonl", help="Fichier JSONL ou dossier Parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default=None,
+                        help="Déduit de l'extension de --output par défaut")
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--prefetch", type=int, default=None, help="Images décodées en vol (défaut : 2 lots)")
+    parser.add_argument("--imgsz", type=int, default=detection.DEFAULT_IMGSZ)
+    parser.add_argument("--conf", type=float, default=detection.DEFAULT_CONF)
+    parser.add_argument("--part-rows", type=int, default=10000,
+                        help="Lignes par fichier Parquet (un fichier n'est lisible qu'une fois fermé)")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.source):
+        model = detection.load_model(args.model)
+        if model is None:
+            raise SystemExit(f"❌ Modèle introuvable : {args.model}")
+        results = model(args.source)
+        results[0].show()  # Affiche les detections
+        return
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "jsonl")
+    # Workers en 'spawn' : ils n'héritent ni de PyTorch ni des threads du modèle chargé ensuite
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        model = detection.load_model(args.model)
+        if model is None:
+            raise SystemExit(f"❌ Modèle introuvable : {args.model}")
+        process_folder(model, executor, args.source, args.output, fmt, args.batch,
+                       args.imgsz, args.conf, args.prefetch or 2 * args.batch, args.part_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Pool de workers d'inférence pour les sessions Streamlit concurrentes.
+
+Chaque worker est un thread qui possède sa propre instance du modèle (le
+prédicteur Ultralytics n'est pas thread-safe) et son propre nombre de threads
+intra-op PyTorch. Les demandes passent par une file bornée : quand elle est
+pleine, `submit` lève `PoolSaturated` au lieu d'accumuler du retard, et chaque
+demande connaît sa position dans la file. Un seul pool sert tous les modèles :
+chaque demande précise ses poids, et un worker remplace son modèle quand ils
+diffèrent de ceux qu'il a chargés (au plus un modèle par worker).
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from cache_resultats import file_signature
+
+
+class PoolSaturated(Exception):
+    """La file du pool est pleine"""
+
+
+class Ticket:
+    """Demande en attente : position dans la file et résultat"""
+
+    def __init__(self, pool, seq, future):
+        self._pool = pool
+        self.seq = seq
+        self.future = future
+
+    def position(self):
+        """Nombre de demandes encore devant celle-ci (0 = en cours de traitement)"""
+        return max(0, self.seq - self._pool.dequeued)
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class WorkerPool:
+    """Workers possédant chacun un modèle, alimentés par une file bornée"""
+
+    def __init__(self, model_path, workers=None, threads_per_worker=None, max_queue=32, warmup=False):
+        cpu = os.cpu_count() or 1
+        self.workers = workers or max(1, cpu // 2)
+        self.threads_per_worker = threads_per_worker or max(1, cpu // self.workers)
+        self.model_path = model_path
+        self.warmup = warmup
+        self.warmup_ms = []
+        self.warm = threading.Event()
+        self.dequeued = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._seq = itertools.count()
+        self._seq_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"model-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        if not warmup:
+            self.warm.set()
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, model_path=None):
+        """Planifie `fn(model)` avec les poids `model_path` ; lève PoolSaturated si la file est pleine"""
+        future = Future()
+        with self._seq_lock:
+            seq = next(self._seq)
+            try:
+                self._queue.put_nowait((seq, fn, future, model_path or self.model_path))
+            except queue.Full:
+                raise PoolSaturated(f"{self._queue.maxsize} demandes déjà en attente")
+        return Ticket(self, seq, future)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    @staticmethod
+    def _load(model_path):
+        from registre_modeles import load_weights
+        return load_weights(model_path), file_signature(model_path)
+
+    def _run(self):
+        # Threads intra-op propres à ce worker (réglage OpenMP local au thread appelant)
+        import torch
+        torch.set_num_threads(self.threads_per_worker)
+        model, signature, loaded_path = None, None, None
+        if self.warmup:
+            # Modèle chargé et préchauffé dès le démarrage du worker, pas à la première demande
+            start = time.perf_counter()
+            try:
+                from detection import warmup
+                model, signature = self._load(self.model_path)
+                loaded_path = self.model_path
+                warmup(model)
+            except Exception:
+                model, signature, loaded_path = None, None, None
+            with self._seq_lock:
+                self.warmup_ms.append((time.perf_counter() - start) * 1000)
+                if len(self.warmup_ms) == self.workers:
+                    self.warm.set()
+        while True:
+            seq, fn, future, model_path = self._queue.get()
+            with self._seq_lock:
+                self.dequeued = max(self.dequeued, seq + 1)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                current = file_signature(model_path)
+                if model is None or model_path != loaded_path or current != signature:
+                    # L'ancien modèle est libéré avant de charger le nouveau
+                    model = None
+                    model, signature = self._load(model_path)
+                    loaded_path = model_path
+                future.set_result(fn(model))
+            except Exception as e:
+                future.set_exception(e)
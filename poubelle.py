@@ -3,26 +3,33 @@ import os
 import numpy as np
 from PIL import Image
 import io
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration pour éviter les problèmes OpenCV
 os.environ['OPENCV_IO_ENABLE_OPENEXR'] = '0'
 os.environ['OPENCV_VIDEOIO_PRIORITY_MSMF'] = '0'
 
-# Import sécurisé d'OpenCV
-try:
-    import cv2
-    CV2_AVAILABLE = True
-except ImportError as e:
-    st.error(f"❌ OpenCV non disponible: {e}")
-    CV2_AVAILABLE = False
+# OpenCV et Ultralytics (donc PyTorch) sont importés en arrière-plan par `demarrage`
+import detection
+from cache_resultats import ResultCache
+from registre_modeles import ModelRegistry, default_model_name
+from pretraitement import crop_padding, map_boxes, prepare
+from instrumentation import METRICS, Timings
+from tuilage import draw_detections, load_bgr, predict_tiled
+from cascade import classify_detections, decode_for_crops, full_classes, load_classifier
+from pool_modeles import PoolSaturated, WorkerPool
+from demarrage import Startup
+from historique import HISTORY_DB, HistoryStore
+from adaptatif import LOW_IMGSZ, escalation_rate, predict_adaptive
+from memoire import CRITICAL, NORMAL, MemoryBudget, SessionTracker, limit_display
+from roi import draw_rois, load_camera_rois, predict_rois, roi_fraction, rois_digest, save_camera_rois
 
-# Import sécurisé d'Ultralytics
 try:
-    from ultralytics import YOLO
-    ULTRALYTICS_AVAILABLE = True
-except ImportError as e:
-    st.error(f"❌ Ultralytics non disponible: {e}")
-    ULTRALYTICS_AVAILABLE = False
+    from streamlit_drawable_canvas import st_canvas
+except ImportError:
+    st_canvas = None
 
 # ---------------------------------------
 # 🎨 CONFIG INTERFACE MODERNE
@@ -388,28 +395,136 @@ st.markdown(custom_css, unsafe_allow_html=True)
 # ---------------------------------------
 # 🧠 CHARGEMENT DU MODÈLE YOLO
 # ---------------------------------------
-MODEL_PATH = "models/best.pt"
+MODEL_PATH = detection.MODEL_PATH
+MODELS_DIR = os.path.dirname(MODEL_PATH)
 
 def ensure_models_directory():
     """Crée le dossier models s'il n'existe pas"""
-    os.makedirs("models", exist_ok=True)
-    return os.path.exists("models")
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    return os.path.exists(MODELS_DIR)
 
 @st.cache_resource
-def load_model(path=MODEL_PATH):
-    if not os.path.exists(path):
-        return None
+def get_model_registry():
+    """Registre des modèles partagé entre les sessions : chaque modèle n'est chargé qu'une fois"""
+    return ModelRegistry(MODELS_DIR)
+
+def load_model(name):
+    """Modèle sélectionné, chargé à la demande et rechargé seulement si ses poids changent"""
     try:
-        model = YOLO(path)
-        st.success("✅ Modèle YOLO initialisé avec succès!")
-        return model
+        return model_registry.get(name)
     except Exception as e:
         st.error(f"❌ Erreur lors du chargement du modèle : {str(e)}")
         return None
 
-# Initialisation
+@st.cache_resource
+def get_result_cache():
+    """Cache des analyses partagé entre les sessions (niveau disque si POUBELLE_CACHE_DIR est défini)"""
+    return ResultCache(
+        max_memory_bytes=int(os.environ.get("POUBELLE_CACHE_MB", "256")) << 20,
+        disk_dir=os.environ.get("POUBELLE_CACHE_DIR") or None,
+        max_disk_bytes=int(os.environ.get("POUBELLE_CACHE_DISK_MB", "2048")) << 20,
+    )
+
+@st.cache_resource
+def get_startup():
+    """Imports lourds et préchauffage du modèle par défaut, lancés une seule fois par processus"""
+    registry = get_model_registry()
+    startup = Startup(registry, default_model_name(registry, MODEL_PATH))
+    startup.start()
+    return startup
+
+@st.cache_resource
+def get_worker_pool():
+    """Pool de workers unique, partagé par toutes les sessions et tous les modèles.
+
+    Chaque demande précise les poids de sa session : changer de modèle ne crée
+    pas de nouveau pool, les workers remplacent simplement leur modèle.
+    """
+    registry = get_model_registry()
+    return WorkerPool(
+        registry.entry(default_model_name(registry, MODEL_PATH)).path,
+        workers=int(os.environ.get("POUBELLE_WORKERS", "0")) or None,
+        threads_per_worker=int(os.environ.get("POUBELLE_THREADS_PER_WORKER", "0")) or None,
+        max_queue=int(os.environ.get("POUBELLE_QUEUE_SIZE", "32")),
+        warmup=True,
+    )
+
+def run_on_pool(fn, wait=False, status=None):
+    """Exécute fn(modèle) sur le pool en affichant la position dans la file d'attente.
+
+    Avec `wait`, une file pleine n'interrompt pas l'analyse : la demande est
+    reproposée avec un délai croissant (une vidéo ne s'arrête pas sur un pic).
+    """
+    status = status or st.empty()
+    delay = 0.05
+    while True:
+        try:
+            ticket = worker_pool.submit(fn, selected_entry.path)
+            break
+        except PoolSaturated:
+            if not wait:
+                raise
+            status.info("⏳ File d'analyse pleine, nouvel essai dans un instant...")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    while not ticket.done():
+        position = ticket.position()
+        if position:
+            status.info(f"⏳ Position dans la file d'analyse : {position}")
+        time.sleep(0.1)
+    status.empty()
+    return ticket.result()
+
+@st.cache_resource
+def get_history_store():
+    """Historique SQLite des détections, partagé par les sessions (écritures regroupées en arrière-plan)"""
+    return HistoryStore(os.environ.get("POUBELLE_HISTORY_DB", HISTORY_DB))
+
+@st.cache_resource
+def get_memory_budget():
+    """Plafond mémoire du processus (POUBELLE_MEMORY_MB, 0 = sans plafond) et suivi des sessions"""
+    budget = MemoryBudget(int(os.environ.get("POUBELLE_MEMORY_MB", "0")) << 20)
+    sessions = SessionTracker(idle_seconds=float(os.environ.get("POUBELLE_SESSION_IDLE_S", "900")))
+    return budget, sessions
+
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+@st.cache_resource
+def get_fill_classifier():
+    """Classifieur de remplissage de la cascade (saved_models/fill_level.h5), s'il est installé, et l'erreur de chargement"""
+    errors = []
+    return load_classifier(on_error=errors.append), (errors[0] if errors else None)
+
+# Initialisation : l'interface s'affiche pendant le chargement de fond
 ensure_models_directory()
-model = load_model() if ULTRALYTICS_AVAILABLE else None
+model_registry = get_model_registry()
+startup = get_startup()
+startup_done = startup.ready.is_set()
+CV2_AVAILABLE = startup.available.get("cv2", False)
+ULTRALYTICS_AVAILABLE = startup.available.get("ultralytics", False)
+if CV2_AVAILABLE:
+    import cv2
+available_models = [e.name for e in model_registry.discover()]
+if st.session_state.get("selected_model") not in available_models:
+    st.session_state.selected_model = default_model_name(model_registry, MODEL_PATH)
+selected_entry = model_registry.entry(st.session_state.selected_model) if st.session_state.selected_model else None
+model = load_model(selected_entry.name) if ULTRALYTICS_AVAILABLE and selected_entry else None
+model_backend = (selected_entry.loaded_backend or selected_entry.backend) if selected_entry else None
+result_cache = get_result_cache() if model is not None else None
+fill_classifier, fill_error = get_fill_classifier() if model is not None else (None, None)
+worker_pool = get_worker_pool() if model is not None else None
+history_store = get_history_store()
+DISPLAY_MAX = int(os.environ.get("POUBELLE_DISPLAY_MAX", "1280"))
+memory_budget, session_tracker = get_memory_budget()
+session_id = current_session_id()
+if session_id:
+    session_tracker.touch(session_id)
+memory_level = memory_budget.check(result_cache, session_tracker, session_id)
+# Le bouton d'analyse n'est activé qu'une fois le modèle et les workers préchauffés
+engine_ready = startup_done and (worker_pool is None or worker_pool.warm.is_set())
 
 # ---------------------------------------
 # 🖥️ HEADER PRINCIPAL
@@ -421,17 +536,23 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Mode dégradé : prévenir toutes les sessions plutôt que de supprimer leurs imports
+if memory_level != NORMAL:
+    st.warning(f"🧠 **Mode mémoire {memory_level}** - Serveur chargé : "
+               + ("nouvelles analyses suspendues pour un instant" if memory_level == CRITICAL
+                  else "mode tuilé désactivé et lots limités à 4 images"))
+
 # Avertissements de dépendances
-if not CV2_AVAILABLE:
-    st.warning("""
-    ⚠️ **Module OpenCV manquant** 
+if startup_done and not CV2_AVAILABLE:
+    st.warning(f"""
+    ⚠️ **Module OpenCV manquant** ({startup.errors.get('cv2')})
     - Fonctionnalités d'affichage limitées
     - L'analyse principale reste opérationnelle
     """)
 
-if not ULTRALYTICS_AVAILABLE:
-    st.error("""
-    ❌ **Module Ultralytics requis**
+if startup_done and not ULTRALYTICS_AVAILABLE:
+    st.error(f"""
+    ❌ **Module Ultralytics requis** ({startup.errors.get('ultralytics')})
     - Impossible d'initialiser les modèles de vision
     - Vérifiez l'installation des composants
     """)
@@ -442,7 +563,17 @@ if not ULTRALYTICS_AVAILABLE:
 st.markdown("<div class='content-card'>", unsafe_allow_html=True)
 st.markdown("### 🧠 Configuration du Système de Vision")
 
-if model is None:
+if available_models:
+    st.selectbox(
+        "Modèle actif",
+        available_models,
+        key="selected_model",
+        help="Poids disponibles dans le dossier models/ ; les modèles déjà chargés restent en mémoire"
+    )
+
+if not engine_ready:
+    st.info("⏳ **Chargement du moteur de vision...** Préchauffage du modèle en arrière-plan")
+elif model is None:
     st.error("""
     🔧 **Configuration requise**
     
@@ -458,9 +589,10 @@ else:
     col_info, col_download = st.columns([2, 1])
     
     with col_info:
-        st.markdown("""
+        st.markdown(f"""
         ### 📊 Spécifications Techniques
         - **Architecture**: YOLOv8 Optimisé
+        - **Moteur d'exécution**: {detection.BACKEND_LABELS.get(model_backend, '—')}
         - **Domaine**: Vision par ordinateur
         - **Statut**: 🟢 Système actif
         - **Performance**: Détection en temps réel
@@ -476,25 +608,47 @@ else:
     with col_download:
         st.markdown("### 📦 Gestion des Modèles")
         
-        # Bouton de téléchargement du modèle actuel
-        if os.path.exists(MODEL_PATH):
-            with open(MODEL_PATH, "rb") as f:
-                model_data = f.read()
-            
-            st.download_button(
-                label="💾 Exporter le Modèle",
-                data=model_data,
-                file_name="model_vision.pt",
-                mime="application/octet-stream",
-                help="Téléchargez le modèle de vision actuel",
-                use_container_width=True,
-                key="download_model"
-            )
-            
-            # Informations sur le modèle
-            file_size = len(model_data) / (1024 * 1024)  # Taille en MB
-            st.info(f"**Poids du modèle:** {file_size:.1f} MB")
-        
+        loaded_models = model_registry.loaded()
+        if loaded_models:
+            st.caption(f"🔥 Modèles prêts en mémoire : {', '.join(loaded_models)}")
+
+        # Export du modèle actuel : le fichier n'est lu qu'à la demande, pas à chaque interaction
+        if selected_entry.is_file:
+            if st.button("📦 Préparer l'export", use_container_width=True, key="prepare_download"):
+                st.session_state.download_ready = selected_entry.name
+
+            if st.session_state.get("download_ready") == selected_entry.name:
+                with open(selected_entry.path, "rb") as f:
+                    st.download_button(
+                        label="💾 Exporter le Modèle",
+                        data=f,
+                        file_name="model_vision" + os.path.splitext(selected_entry.name)[1],
+                        mime="application/octet-stream",
+                        help="Téléchargez le modèle de vision actuel",
+                        use_container_width=True,
+                        key="download_model"
+                    )
+                # Affiché une seule fois : les exécutions suivantes ne relisent pas le fichier
+                del st.session_state.download_ready
+
+        # Informations sur le modèle
+        file_size = selected_entry.size_bytes() / (1024 * 1024)  # Taille en MB
+        st.info(f"**Poids du modèle:** {file_size:.1f} MB")
+
+        memory = memory_budget.usage()
+        ceiling = f" / {memory['limit_bytes'] >> 20} Mo ({memory['ratio']:.0%})" if memory["limit_bytes"] else ""
+        st.caption(f"🧠 Mémoire du processus : {memory['rss_bytes'] >> 20} Mo{ceiling} • "
+                   f"{len(session_tracker)} session(s) active(s) • mode {memory_level}")
+        measures = selected_entry.metadata()
+        if measures:
+            st.caption(f"📏 mAP50 {measures.get('map50', 0):.3f} • mAP50-95 {measures.get('map50_95', 0):.3f} • "
+                       f"latence CPU p50 {measures.get('latency_p50_ms', 0):.0f} ms")
+
+        with st.expander(f"⏱️ Démarrage à froid • {startup.timings.total() / 1000:.1f} s"):
+            st.dataframe(startup.timings.rows(), use_container_width=True, hide_index=True)
+            if worker_pool.warmup_ms:
+                st.caption(f"🔥 Préchauffage des workers : {max(worker_pool.warmup_ms) / 1000:.1f} s")
+
         st.markdown("---")
         st.markdown("### 🔗 Ressources")
         st.markdown("""
@@ -520,27 +674,469 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-uploaded_img = st.file_uploader(
-    " ",
-    type=["jpg", "jpeg", "png", "bmp"],
-    key="main_uploader",
+mode_acquisition = st.radio(
+    "Mode d'acquisition",
+    ["🖼️ Image unique", "🗂️ Lot d'images", "🎥 Vidéo / Flux", "📊 Historique"],
+    horizontal=True,
+    key="mode_acquisition",
     label_visibility="collapsed"
 )
 
+uploaded_img = None
+uploaded_batch = []
+tiled_mode = False
+fill_mode = False
+adaptive_mode = False
+ADAPTIVE_HELP = f"Analyse d'abord à {LOW_IMGSZ} px et ne reprend à 640 que les images incertaines"
+video_source = None
+history_source = ""
+source_rois = None
+roi_mode = False
+
+if mode_acquisition != "📊 Historique":
+    history_source = st.text_input(
+        "Identifiant de la source (caméra, poubelle)",
+        key="history_source",
+        help="Enregistré avec chaque détection dans l'historique ; le nom du fichier est utilisé s'il est vide"
+    ).strip()
+    source_rois = load_camera_rois().get(history_source) if history_source else None
+
+
+def roi_toggle():
+    """Analyse limitée aux zones d'intérêt de la source, si elle en a"""
+    if not source_rois:
+        return False
+    return st.toggle(
+        f"🎯 Zones d'intérêt uniquement ({len(source_rois)} zone(s), {roi_fraction(source_rois):.0%} de l'image)",
+        value=True,
+        key="roi_mode",
+        help="Seules les zones dessinées pour cette source passent dans le détecteur"
+    )
+
+if mode_acquisition == "📊 Historique":
+    col_period, col_source, col_days = st.columns(3)
+    with col_period:
+        history_period = st.selectbox("Agrégation", ["hour", "day"],
+                                      format_func=lambda p: {"hour": "Par heure", "day": "Par jour"}[p])
+    with col_source:
+        history_filter = st.selectbox("Source", ["Toutes"] + history_store.sources())
+    with col_days:
+        history_days = st.slider("Période (jours)", min_value=1, max_value=90, value=7)
+elif mode_acquisition == "🗂️ Lot d'images":
+    uploaded_batch = st.file_uploader(
+        " ",
+        type=["jpg", "jpeg", "png", "bmp"],
+        accept_multiple_files=True,
+        key="batch_uploader",
+        label_visibility="collapsed"
+    ) or []
+    batch_size = st.slider(
+        "Taille des lots d'inférence",
+        min_value=1,
+        max_value=32 if memory_level == NORMAL else 4,
+        value=8 if memory_level == NORMAL else 4,
+        help="Nombre d'images envoyées ensemble au modèle à chaque passe"
+    )
+    adaptive_mode = st.toggle(f"⚡ Mode adaptatif ({LOW_IMGSZ} → 640)", help=ADAPTIVE_HELP, key="adaptive_batch")
+elif mode_acquisition == "🎥 Vidéo / Flux":
+    uploaded_video = st.file_uploader(
+        " ",
+        type=["mp4", "avi", "mov", "mkv"],
+        key="video_uploader",
+        label_visibility="collapsed"
+    )
+    stream_url = st.text_input("URL du flux caméra (rtsp://, http://...)", key="stream_url")
+    video_source = uploaded_video or stream_url.strip() or None
+    roi_mode = roi_toggle()
+
+    col_stride, col_preview, col_max = st.columns(3)
+    with col_stride:
+        frame_stride = st.slider("Analyser une image sur", min_value=1, max_value=30, value=5)
+    with col_preview:
+        preview_fps = st.slider("Rafraîchissement de l'aperçu (img/s)", min_value=0.5, max_value=10.0, value=2.0, step=0.5)
+    with col_max:
+        max_frames = st.number_input("Images analysées max (0 = illimité)", min_value=0, value=0, step=10)
+
+    gating_mode = st.toggle(
+        "⏸️ Ignorer les scènes inchangées",
+        help="Réutilise les dernières détections tant que l'image ne change pas (caméras fixes)"
+    )
+    if gating_mode:
+        col_threshold, col_method, col_refresh = st.columns(3)
+        with col_threshold:
+            gate_threshold = st.slider("Seuil de changement", min_value=0.005, max_value=0.2, value=0.03, step=0.005,
+                                       help="Écart moyen (ou part de bits du hachage) au-delà duquel l'image est réanalysée")
+        with col_method:
+            gate_method = st.selectbox("Comparaison", ["diff", "phash"],
+                                       format_func=lambda m: {"diff": "Différence réduite", "phash": "Hachage perceptuel"}[m])
+        with col_refresh:
+            gate_interval = st.number_input("Rafraîchissement forcé (s)", min_value=1, value=60, step=5)
+else:
+    uploaded_img = st.file_uploader(
+        " ",
+        type=["jpg", "jpeg", "png", "bmp"],
+        key="main_uploader",
+        label_visibility="collapsed"
+    )
+    roi_mode = roi_toggle()
+    # Mode réduit : pas de décodage pleine résolution
+    tiled_mode = not roi_mode and st.toggle(
+        "🧩 Mode tuilé (haute résolution)",
+        disabled=memory_level != NORMAL,
+        help="Découpe l'image en tuiles de 640 qui se chevauchent pour détecter les petits objets des images 4K"
+    ) and memory_level == NORMAL
+    if not tiled_mode and not roi_mode:
+        adaptive_mode = st.toggle(
+            f"⚡ Mode adaptatif ({LOW_IMGSZ} → 640 → tuilé)",
+            help=ADAPTIVE_HELP + ", puis en tuiles si le doute persiste",
+            key="adaptive_single"
+        )
+    if fill_error:
+        st.warning(f"⚠️ {fill_error}")
+    if fill_classifier is not None:
+        fill_mode = st.toggle(
+            "🧪 Niveau de remplissage (cascade)",
+            value=True,
+            help="Classe chaque poubelle détectée (vide / pleine) avec le classifieur léger, en un seul lot"
+        )
+
+
+def roi_sample_frame(source):
+    """Image de référence (RGB, 640 px max) d'une image ou d'une vidéo importée, ou d'un flux"""
+    if isinstance(source, str) or source.type.startswith("video/"):
+        if not CV2_AVAILABLE:
+            return None
+        name = source if isinstance(source, str) else source.name
+        cached = st.session_state.get("roi_sample")
+        if cached and cached[0] == name:
+            return cached[1]
+        path = source
+        if not isinstance(source, str):
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(source.name)[1], delete=False) as tmp:
+                tmp.write(source.getbuffer())
+                path = tmp.name
+        capture = cv2.VideoCapture(path)
+        ok, frame = capture.read()
+        capture.release()
+        if path is not source:
+            os.remove(path)
+        if not ok:
+            return None
+        sample = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        sample.thumbnail((detection.DEFAULT_IMGSZ, detection.DEFAULT_IMGSZ))
+        st.session_state.roi_sample = (name, sample)
+        return sample
+    sample = Image.open(source)
+    sample.draft("RGB", (detection.DEFAULT_IMGSZ, detection.DEFAULT_IMGSZ))
+    sample = sample.convert("RGB")
+    sample.thumbnail((detection.DEFAULT_IMGSZ, detection.DEFAULT_IMGSZ))
+    source.seek(0)
+    return sample
+
+
+def edit_rois(sample, rois, key):
+    """Zones dessinées sur l'image de référence (coordonnées normalisées)"""
+    width, height = sample.size
+    if st_canvas is not None:
+        result = st_canvas(
+            fill_color="rgba(52, 152, 219, 0.2)",
+            stroke_width=2,
+            stroke_color="#3498db",
+            background_image=sample,
+            drawing_mode="rect",
+            initial_drawing={"version": "4.4.0", "objects": [{
+                "type": "rect", "left": x1 * width, "top": y1 * height,
+                "width": (x2 - x1) * width, "height": (y2 - y1) * height,
+                "fill": "rgba(52, 152, 219, 0.2)", "stroke": "#3498db", "strokeWidth": 2,
+            } for x1, y1, x2, y2 in rois]},
+            width=width,
+            height=height,
+            key=key,
+        )
+        if result is None or result.json_data is None:
+            return rois
+        return [[o["left"] / width, o["top"] / height,
+                 (o["left"] + o["width"] * o.get("scaleX", 1)) / width,
+                 (o["top"] + o["height"] * o.get("scaleY", 1)) / height]
+                for o in result.json_data.get("objects", []) if o.get("type") == "rect"]
+
+    # Sans streamlit-drawable-canvas : une paire de curseurs par zone
+    count = st.number_input("Nombre de zones", min_value=0, max_value=8, value=len(rois), key=f"{key}_count")
+    edited = []
+    for i in range(int(count)):
+        x1, y1, x2, y2 = rois[i] if i < len(rois) else (0.25, 0.25, 0.75, 0.75)
+        col_x, col_y = st.columns(2)
+        with col_x:
+            xs = st.slider(f"Zone {i + 1} : horizontal (%)", 0, 100, (round(x1 * 100), round(x2 * 100)),
+                           key=f"{key}_x{i}")
+        with col_y:
+            ys = st.slider(f"Zone {i + 1} : vertical (%)", 0, 100, (round(y1 * 100), round(y2 * 100)),
+                           key=f"{key}_y{i}")
+        edited.append([xs[0] / 100, ys[0] / 100, xs[1] / 100, ys[1] / 100])
+    st.image(draw_rois(np.array(sample), edited), use_container_width=True)
+    return edited
+
+
+roi_sample_source = uploaded_img if mode_acquisition == "🖼️ Image unique" else video_source
+if history_source and mode_acquisition in ("🖼️ Image unique", "🎥 Vidéo / Flux"):
+    with st.expander(f"🎯 Zones d'intérêt • {history_source}"):
+        try:
+            sample = roi_sample_frame(roi_sample_source) if roi_sample_source else None
+        except Exception:
+            sample = None
+        if sample is None:
+            st.info("Importez une image ou une vidéo de cette source pour dessiner ses zones d'intérêt")
+        else:
+            edited_rois = edit_rois(sample, source_rois or [], key=f"roi_{history_source}")
+            st.caption(f"Part de l'image analysée : {roi_fraction(edited_rois):.0%}")
+            col_save, col_clear = st.columns(2)
+            with col_save:
+                if st.button("💾 Enregistrer les zones", use_container_width=True, disabled=not edited_rois):
+                    save_camera_rois(history_source, edited_rois)
+                    st.rerun()
+            with col_clear:
+                if st.button("🗑️ Effacer les zones", use_container_width=True, disabled=not source_rois):
+                    save_camera_rois(history_source, [])
+                    st.rerun()
+
 st.markdown("</div>", unsafe_allow_html=True)
 
+# ---------------------------------------
+# 🗂️ TRAITEMENT PAR LOTS
+# ---------------------------------------
+THUMBNAIL_SIZE = (256, 256)
+GRID_COLUMNS = 4
+
+def decode_upload(uploaded_file, out):
+    """Décode une image importée dans son tampon letterbox et prépare sa vignette"""
+    try:
+        prepared = prepare(uploaded_file, detection.DEFAULT_IMGSZ, out=out)
+    except Exception as e:
+        return uploaded_file.name, None, None, str(e)
+    thumbnail = prepared.display.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    return uploaded_file.name, prepared, thumbnail, None
+
+def iter_decoded_batches(files, size, executor):
+    """Décode les lots en parallèle, en préparant le lot suivant pendant l'inférence du lot courant"""
+    chunks = [files[i:i + size] for i in range(0, len(files), size)]
+    # Double tampon : le lot suivant est décodé pendant que le lot courant est analysé
+    imgsz = detection.DEFAULT_IMGSZ
+    buffers = np.empty((2, size, imgsz, imgsz, 3), dtype=np.uint8)
+
+    def submit(idx):
+        return [executor.submit(decode_upload, f, buffers[idx % 2][j]) for j, f in enumerate(chunks[idx])]
+
+    pending = submit(0) if chunks else []
+    for idx in range(len(chunks)):
+        current = pending
+        if idx + 1 < len(chunks):
+            pending = submit(idx + 1)
+        yield [future.result() for future in current]
+
+def encode_jpeg(image_rgb, quality=90):
+    """Encode une image RGB en JPEG (format compact pour le cache et l'affichage)"""
+    buffer = io.BytesIO()
+    Image.fromarray(image_rgb).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def summarize_result(detections):
+    """Résumé compact des détections d'une image : nombre d'objets, classe principale et confiance max"""
+    if not detections:
+        return 0, None, 0.0
+    best = max(detections, key=lambda d: d["confidence"])
+    return len(detections), best["class_name"], best["confidence"]
+
 # ---------------------------------------
 # 🖼️ PROCESSUS D'ANALYSE
 # ---------------------------------------
-if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
+if (uploaded_img or uploaded_batch or video_source) and not engine_ready:
+    st.button(
+        "⏳ Préchauffage du modèle...",
+        disabled=True,
+        use_container_width=True,
+        help="L'analyse sera disponible dès la fin du chargement en arrière-plan"
+    )
+
+elif (uploaded_img or uploaded_batch or video_source) and memory_level == CRITICAL:
+    st.warning("🧠 **Mémoire saturée** - Les nouvelles analyses sont suspendues, réessayez dans un instant")
+
+elif video_source and ULTRALYTICS_AVAILABLE and model is not None and not CV2_AVAILABLE:
+    st.error("❌ Module OpenCV requis pour l'analyse vidéo")
+
+elif video_source and ULTRALYTICS_AVAILABLE and model is not None:
+    from gating import FrameGate
+    from video import PreviewThrottle, iter_video_detections
+
+    st.markdown("<div class='content-card'>", unsafe_allow_html=True)
+    st.markdown("### 🎥 Analyse Vidéo")
+
+    analyze_video = st.button(
+        "🚀 Démarrer l'Analyse Vidéo",
+        type="primary",
+        use_container_width=True,
+        help="Décode la vidéo en arrière-plan et analyse une image sur N"
+    )
+
+    if analyze_video:
+        video_path = video_source
+        temp_path = None
+        video_label = history_source or (video_source if isinstance(video_source, str) else video_source.name)
+        if not isinstance(video_source, str):
+            # OpenCV lit depuis un chemin : la vidéo importée est écrite dans un fichier temporaire
+            suffix = os.path.splitext(video_source.name)[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                tmp.write(video_source.getbuffer())
+                temp_path = video_path = tmp.name
+
+        preview = st.empty()
+        status = st.empty()
+        queue_status = st.empty()
+        throttle = PreviewThrottle(preview_fps)
+        gate = FrameGate(gate_threshold, gate_method, gate_interval) if gating_mode else None
+        frame_rows = []
+        try:
+            for index, timestamp, dets, frame, r, reused in iter_video_detections(
+                model, video_path, stride=frame_stride, max_frames=int(max_frames) or None, gate=gate,
+                rois=source_rois if roi_mode else None,
+                # Inférence sur le pool, comme les autres modes ; une file pleine fait attendre, sans interrompre
+                run=lambda fn: run_on_pool(fn, wait=True, status=queue_status)
+            ):
+                frame_rows.append({
+                    "image": index,
+                    "temps (s)": round(timestamp, 2),
+                    "objets": len(dets),
+                    "classes": ", ".join(sorted({d["class_name"] for d in dets})),
+                    "confiance max": round(max((d["confidence"] for d in dets), default=0.0), 3),
+                    "réutilisé": reused,
+                })
+                if not reused:
+                    history_store.record(video_label, dets)
+                if throttle.ready():
+                    if r is not None:
+                        preview_rgb = cv2.cvtColor(r.plot(), cv2.COLOR_BGR2RGB)
+                    else:
+                        # Analyse par zones : pas de résultat YOLO pour l'image entière
+                        preview_rgb = draw_rois(draw_detections(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), dets),
+                                                source_rois)
+                    preview.image(limit_display(preview_rgb, DISPLAY_MAX),
+                                  caption=f"🟢 Image {index} • {len(dets)} objet(s)", use_container_width=True)
+                    status.caption(f"🔍 {len(frame_rows)} image(s) analysée(s)")
+        except Exception as e:
+            st.error(f"❌ Erreur d'analyse vidéo: {e}")
+        finally:
+            if temp_path:
+                os.remove(temp_path)
+
+        status.caption(f"✅ {len(frame_rows)} image(s) analysée(s)")
+        if gate is not None and gate.frames:
+            st.metric("⏸️ Images sautées", f"{gate.skip_ratio():.0%}",
+                      help=f"{gate.inferences} inférence(s) réelle(s) pour {gate.frames} image(s)")
+        if frame_rows:
+            st.markdown("### 🔬 Détections par Image")
+            st.dataframe(frame_rows, use_container_width=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+elif uploaded_batch and ULTRALYTICS_AVAILABLE and model is not None:
+    st.markdown("<div class='content-card'>", unsafe_allow_html=True)
+    st.markdown(f"### 🗂️ Lot de {len(uploaded_batch)} image(s)")
+
+    analyze_batch = st.button(
+        "🚀 Analyser le Lot",
+        type="primary",
+        use_container_width=True,
+        help="Décode les images en parallèle et les analyse par lots"
+    )
+
+    if analyze_batch:
+        summaries = []
+        # Niveaux de ce lot seulement : le compteur global mélange toutes les sessions
+        batch_levels = []
+        progress = st.progress(0.0, text="🔍 Analyse du lot en cours...")
+        done = 0
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+            for decoded in iter_decoded_batches(uploaded_batch, batch_size, executor):
+                valid = [d for d in decoded if d[1] is not None]
+                for name, _, _, error in decoded:
+                    if error is not None:
+                        summaries.append((name, None, 0, None, 0.0, error))
+
+                if valid:
+                    batch_prepared = [d[1] for d in valid]
+                    try:
+                        if adaptive_mode:
+                            outputs = run_on_pool(lambda m: predict_adaptive(m, batch_prepared))
+                            batch_dets = [o.detections for o in outputs]
+                            batch_levels.extend(o.level for o in outputs)
+                        else:
+                            results = run_on_pool(lambda m: detection.predict(m, [p.array for p in batch_prepared]))
+                            batch_dets = [map_boxes(detection.extract_detections(model, r), p)
+                                          for p, r in zip(batch_prepared, results)]
+                    except Exception as e:
+                        batch_dets = None
+                        for name, _, thumb, _ in valid:
+                            summaries.append((name, thumb, 0, None, 0.0, str(e)))
+                    if batch_dets:
+                        for (name, _, thumb, _), dets in zip(valid, batch_dets):
+                            history_store.record(history_source or name, dets)
+                            count, cls_name, best_conf = summarize_result(dets)
+                            summaries.append((name, thumb, count, cls_name, best_conf, None))
+
+                done += len(decoded)
+                progress.progress(done / len(uploaded_batch), text=f"🔍 {done}/{len(uploaded_batch)} images analysées")
+        progress.empty()
+        if adaptive_mode and batch_levels:
+            st.caption(f"⚡ Escalade au-delà de {LOW_IMGSZ} : {escalation_rate(batch_levels):.0%} des "
+                       f"{len(batch_levels)} images de ce lot")
+
+        # Métriques globales du lot
+        total_objects = sum(s[2] for s in summaries)
+        with_dets = sum(1 for s in summaries if s[2] > 0)
+        st.markdown("<div class='stats-container'>", unsafe_allow_html=True)
+        st.markdown(f"""
+        <div class="stat-item">
+            <span class="stat-number">{len(summaries)}</span>
+            <span class="stat-label">Images Analysées</span>
+        </div>
+        <div class="stat-item">
+            <span class="stat-number">{with_dets}</span>
+            <span class="stat-label">Images avec Détections</span>
+        </div>
+        <div class="stat-item">
+            <span class="stat-number">{total_objects}</span>
+            <span class="stat-label">Objets Identifiés</span>
+        </div>
+        """, unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+        # Grille de résumé par image
+        for row_start in range(0, len(summaries), GRID_COLUMNS):
+            cols = st.columns(GRID_COLUMNS)
+            for col, (name, thumb, count, cls_name, best_conf, error) in zip(cols, summaries[row_start:row_start + GRID_COLUMNS]):
+                with col:
+                    if thumb is not None:
+                        st.image(thumb, use_container_width=True)
+                    if error is not None:
+                        st.caption(f"❌ **{name}** • {error}")
+                    elif count > 0:
+                        st.caption(f"🎯 **{name}** • {count} objet(s) • {cls_name.upper()} {int(best_conf * 100)}%")
+                    else:
+                        st.caption(f"⚪ **{name}** • aucune détection")
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+elif uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
     # Layout principal pour visualisation
     col1, col2 = st.columns([1, 1])
+    timings = Timings()
     
     with col1:
         st.markdown("<div class='content-card'>", unsafe_allow_html=True)
         st.markdown("### 🖼️ Image Source")
         try:
-            image = Image.open(uploaded_img).convert("RGB")
+            prepared = prepare(uploaded_img, detection.DEFAULT_IMGSZ, timings=timings)
+            image = prepared.display
             st.image(image, caption="Image importée pour analyse", use_container_width=True)
         except Exception as e:
             st.error(f"❌ Erreur de traitement: {e}")
@@ -559,40 +1155,172 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
     
     if analyze:
         with st.spinner("🔍 **Scan en cours...** Le système analyse l'image"):
-            # Conversion et prédiction
-            img_array = np.array(image)
-            
-            try:
-                results = model.predict(img_array, conf=0.25, imgsz=640)
-            except Exception as e:
-                st.error(f"❌ Erreur d'analyse: {e}")
-                results = None
-
-            if results and len(results) > 0:
-                r = results[0]
+            # Réutilisation d'une analyse identique (même image, même modèle, mêmes paramètres)
+            with timings.stage("cache"):
+                # Vue sur le tampon de l'import : pas de copie des octets pour le hachage
+                cache_key = result_cache.key(uploaded_img.getbuffer(), detection.DEFAULT_CONF,
+                                             detection.DEFAULT_IMGSZ,
+                                             kind=f"annotated-roi-{rois_digest(source_rois)}" if roi_mode
+                                             else "annotated-tiled" if tiled_mode
+                                             else "annotated-adaptive" if adaptive_mode else "annotated",
+                                             model_path=selected_entry.path)
+                analysis = result_cache.get(cache_key)
+                # Un résultat repris du cache a déjà été enregistré dans l'historique
+                fresh_analysis = analysis is None
+
+            if analysis is None and roi_mode:
+                # Seules les zones d'intérêt de la source passent dans le modèle, à l'échelle de l'image letterboxée
+                try:
+                    display_bgr = np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+                    with timings.stage("roi_inference"):
+                        roi_dets = run_on_pool(lambda m: predict_rois(m, display_bgr, source_rois,
+                                                                      scale=prepared.scale,
+                                                                      original_size=prepared.original_size))
+                except PoolSaturated as e:
+                    st.warning(f"🚦 Système saturé, réessayez dans un instant ({e})")
+                    roi_dets = None
+                except Exception as e:
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    roi_dets = None
+
+                if roi_dets is not None:
+                    annotated_jpeg = None
+                    if CV2_AVAILABLE:
+                        with timings.stage("plot"):
+                            annotated_rgb = draw_rois(draw_detections(np.array(image), roi_dets, prepared.scale),
+                                                      source_rois)
+                            annotated_jpeg = encode_jpeg(annotated_rgb)
+                            del annotated_rgb
+                    analysis = {"detections": roi_dets, "annotated": annotated_jpeg,
+                                "roi": roi_fraction(source_rois)}
+                    result_cache.put(cache_key, analysis)
+
+            elif analysis is None and tiled_mode:
+                # Tuiles découpées dans l'image pleine résolution, boîtes fusionnées par NMS
+                try:
+                    with timings.stage("decode_full"):
+                        uploaded_img.seek(0)
+                        full_bgr = load_bgr(uploaded_img)
+                    with timings.stage("tiled_inference"):
+                        tiled_dets = run_on_pool(lambda m: predict_tiled(m, full_bgr))
+                    del full_bgr
+                except PoolSaturated as e:
+                    st.warning(f"🚦 Système saturé, réessayez dans un instant ({e})")
+                    tiled_dets = None
+                except Exception as e:
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    tiled_dets = None
+
+                if tiled_dets is not None:
+                    annotated_jpeg = None
+                    if CV2_AVAILABLE:
+                        with timings.stage("plot"):
+                            annotated_rgb = draw_detections(np.array(image), tiled_dets, prepared.scale)
+                            annotated_jpeg = encode_jpeg(annotated_rgb)
+                            del annotated_rgb
+                    analysis = {"detections": tiled_dets, "annotated": annotated_jpeg}
+                    result_cache.put(cache_key, analysis)
+
+            elif analysis is None and adaptive_mode:
+                # Basse résolution d'abord ; 640 puis tuiles seulement pour les images incertaines
+                try:
+                    adaptive = run_on_pool(lambda m: predict_adaptive(
+                        m, [prepared], timings=timings,
+                        load_full=(lambda i: uploaded_img.seek(0) or load_bgr(uploaded_img))
+                        if memory_level == NORMAL else None)[0])
+                except PoolSaturated as e:
+                    st.warning(f"🚦 Système saturé, réessayez dans un instant ({e})")
+                    adaptive = None
+                except Exception as e:
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    adaptive = None
+
+                if adaptive is not None:
+                    annotated_jpeg = None
+                    if CV2_AVAILABLE:
+                        with timings.stage("plot"):
+                            if adaptive.result is not None:
+                                annotated_rgb = cv2.cvtColor(crop_padding(adaptive.result.plot(), adaptive.prepared),
+                                                             cv2.COLOR_BGR2RGB)
+                            else:
+                                annotated_rgb = draw_detections(np.array(image), adaptive.detections, prepared.scale)
+                            annotated_jpeg = encode_jpeg(annotated_rgb)
+                            del annotated_rgb
+                    analysis = {"detections": adaptive.detections, "annotated": annotated_jpeg,
+                                "level": adaptive.level, "reason": adaptive.reason}
+                    result_cache.put(cache_key, analysis)
+                del adaptive
+
+            elif analysis is None:
+                # Prédiction sur l'image déjà letterboxée
+                try:
+                    results = run_on_pool(lambda m: detection.predict(m, prepared.array))
+                except PoolSaturated as e:
+                    st.warning(f"🚦 Système saturé, réessayez dans un instant ({e})")
+                    results = None
+                except Exception as e:
+                    st.error(f"❌ Erreur d'analyse: {e}")
+                    results = None
+
+                if results and len(results) > 0:
+                    r = results[0]
+                    timings.record_yolo(r)
+                    annotated_jpeg = None
+                    if CV2_AVAILABLE:
+                        try:
+                            # Annotation avec visualisation
+                            with timings.stage("plot"):
+                                annotated_rgb = cv2.cvtColor(crop_padding(r.plot(), prepared), cv2.COLOR_BGR2RGB)
+                                annotated_jpeg = encode_jpeg(annotated_rgb)
+                                del annotated_rgb
+                        except Exception:
+                            annotated_jpeg = None
+                    analysis = {
+                        "detections": map_boxes(detection.extract_detections(model, r), prepared),
+                        "annotated": annotated_jpeg,
+                    }
+                    result_cache.put(cache_key, analysis)
+                    del r
+                # Libération immédiate : le résultat YOLO garde l'image letterboxée et ses tenseurs
+                del results
+
+            if analysis is not None:
+                render_start = time.perf_counter()
 
                 # Affichage résultats dans colonne 2
                 with col2:
                     st.markdown("<div class='content-card'>", unsafe_allow_html=True)
                     st.markdown("### 📈 Résultats de l'Analyse")
-                    
-                    if CV2_AVAILABLE:
-                        try:
-                            # Annotation avec visualisation
-                            annotated = r.plot()
-                            annotated_rgb = cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
-                            st.image(annotated_rgb, caption="🟢 Détections par vision artificielle", use_container_width=True)
-                        except Exception as e:
-                            st.warning("⚠️ Visualisation avancée non disponible")
-                            st.image(image, caption="Image source (mode basique)", use_container_width=True)
+
+                    if analysis["annotated"] is not None:
+                        st.image(analysis["annotated"], caption="🟢 Détections par vision artificielle", use_container_width=True)
+                    elif CV2_AVAILABLE:
+                        st.warning("⚠️ Visualisation avancée non disponible")
+                        st.image(image, caption="Image source (mode basique)", use_container_width=True)
                     else:
                         st.image(image, caption="Image source (module vision non disponible)", use_container_width=True)
-                    
+
+                    if analysis.get("roi") is not None:
+                        st.caption(f"🎯 Zones d'intérêt : {analysis['roi']:.0%} de l'image analysée")
+                    if analysis.get("level"):
+                        reason = f" ({analysis['reason']})" if analysis.get("reason") else ""
+                        st.caption(f"⚡ Résolution retenue : {analysis['level']}{reason}")
+                    cache_stats = result_cache.stats()
+                    st.caption(f"♻️ Cache : {cache_stats['hits']} réutilisation(s) • {cache_stats['misses']} analyse(s) complète(s)")
                     st.markdown("</div>", unsafe_allow_html=True)
 
                 # Métriques de performance
-                dets = getattr(r, "boxes", None)
-                if dets and len(dets) > 0:
+                dets = analysis["detections"]
+                if dets and fill_mode:
+                    with timings.stage("fill_level"):
+                        # Découpes prises dans l'image importée : l'aperçu à 640 px est trop petit pour le classifieur
+                        uploaded_img.seek(0)
+                        source, scale = decode_for_crops(uploaded_img, dets, fill_classifier.img_size)
+                        classify_detections(fill_classifier, source, dets, scale)
+                        del source
+                if fresh_analysis:
+                    history_store.record(history_source or uploaded_img.name, dets)
+                if dets:
                     st.markdown("<div class='stats-container'>", unsafe_allow_html=True)
                     st.markdown(f"""
                     <div class="stat-item">
@@ -614,10 +1342,11 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
                     st.markdown("<div class='content-card'>", unsafe_allow_html=True)
                     st.markdown("### 🔬 Analyse Détaillée")
                     
-                    for i, box in enumerate(dets, start=1):
-                        cls_idx = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        cls_name = model.names[cls_idx] if hasattr(model, "names") else str(cls_idx)
+                    for i, det in enumerate(dets, start=1):
+                        cls_name = det["class_name"]
+                        conf = det["confidence"]
+                        if "fill_level" in det:
+                            cls_name += f" • {det['fill_level']} {int(det['fill_confidence'] * 100)}%"
                         
                         # Affichage avec métriques de confiance
                         conf_percent = int(conf * 100)
@@ -637,10 +1366,43 @@ if uploaded_img and ULTRALYTICS_AVAILABLE and model is not None:
                     st.markdown("</div>", unsafe_allow_html=True)
                 else:
                     st.warning("🎯 Aucun objet détecté dans le cadre d'analyse")
+
+                timings.record("render", (time.perf_counter() - render_start) * 1000)
+                METRICS.observe(timings)
+                with st.expander(f"⏱️ Détail des temps de traitement • {timings.total():.0f} ms"):
+                    st.dataframe(timings.rows(), use_container_width=True, hide_index=True)
             else:
                 st.error("❌ Aucune donnée d'analyse générée")
 
-elif uploaded_img and (not ULTRALYTICS_AVAILABLE or model is None):
+elif mode_acquisition == "📊 Historique":
+    st.markdown("<div class='content-card'>", unsafe_allow_html=True)
+    st.markdown("### 📊 Historique des Détections")
+
+    # Lecture des agrégats horaires / journaliers, jamais de la table brute
+    rows = history_store.rollup(
+        history_period,
+        since=time.time() - history_days * 86400,
+        source=None if history_filter == "Toutes" else history_filter,
+        full_classes=fill_classifier.full_classes if fill_classifier is not None else full_classes(),
+    )
+    if rows:
+        label_format = "%d/%m %Hh" if history_period == "hour" else "%d/%m/%Y"
+        for row in rows:
+            row["période"] = time.strftime(label_format, time.localtime(row["période"]))
+        st.bar_chart(rows, x="période", y="objets")
+        filled = [row for row in rows if row["taux de remplissage"] is not None]
+        if filled:
+            st.markdown("#### 🧪 Taux de remplissage")
+            st.line_chart(filled, x="période", y="taux de remplissage")
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("📭 Aucune détection enregistrée sur cette période")
+
+    if history_store.dropped:
+        st.warning(f"⚠️ {history_store.dropped} détection(s) non enregistrée(s) (file d'écriture saturée)")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+elif (uploaded_img or uploaded_batch or video_source) and (not ULTRALYTICS_AVAILABLE or model is None):
     st.error("❌ Système de vision non opérationnel - Analyse impossible")
 
 else:
@@ -711,3 +1473,10 @@ st.markdown("""
     <p style='font-size: 1rem; opacity: 0.8; line-height: 1.5;'>Technologie de détection avancée • Intelligence artificielle embarquée • Performance optimisée</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Le script attend la fin du chargement de fond, puis se relance pour activer l'analyse
+if not engine_ready:
+    startup.ready.wait()
+    if worker_pool is not None:
+        worker_pool.warm.wait()
+    st.rerun()
@@ -0,0 +1,108 @@
+"""Décodage rapide et letterbox unique avant l'inférence.
+
+Les JPEG sont décodés directement à une résolution réduite (mode `draft` de
+PIL, via la mise à l'échelle DCT), au plus proche de la taille d'inférence.
+L'image est redimensionnée une seule fois puis copiée, en BGR, dans un tampon
+carré réutilisable : Ultralytics n'a plus rien à redimensionner et aucune copie
+pleine résolution n'est créée. Les boîtes sont ensuite ramenées dans les
+coordonnées de l'image d'origine.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+import detection
+
+PAD_VALUE = 114
+
+Prepared = namedtuple("Prepared", ["array", "display", "scale", "pad", "original_size"])
+
+_buffers = threading.local()
+
+
+def letterbox_buffer(imgsz=detection.DEFAULT_IMGSZ):
+    """Tampon letterbox réutilisable, propre au thread courant"""
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or buffer.shape[0] != imgsz:
+        buffer = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+        _buffers.buffer = buffer
+    return buffer
+
+
+def prepare(source, imgsz=detection.DEFAULT_IMGSZ, out=None, timings=None):
+    """Décode une image et la letterboxe dans `out` (ou dans le tampon du thread).
+
+    Le tableau retourné partage la mémoire du tampon : il doit être consommé
+    avant le prochain appel utilisant le même tampon.
+    """
+    start = time.perf_counter()
+    image = Image.open(source)
+    original_size = image.size
+    ratio = imgsz / max(original_size)
+    if image.format == "JPEG" and ratio < 1:
+        # Décodage à l'échelle 1/2, 1/4 ou 1/8, en restant au-dessus de la taille cible
+        image.draft("RGB", (math.ceil(original_size[0] * ratio), math.ceil(original_size[1] * ratio)))
+    image = image.convert("RGB")
+    if timings is not None:
+        timings.record("decode", (time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+
+    resize_ratio = imgsz / max(image.size)
+    new_size = (max(1, round(image.size[0] * resize_ratio)), max(1, round(image.size[1] * resize_ratio)))
+    if new_size != image.size:
+        image = image.resize(new_size, Image.BILINEAR)
+
+    if out is None:
+        out = letterbox_buffer(imgsz)
+    left = (imgsz - new_size[0]) // 2
+    top = (imgsz - new_size[1]) // 2
+    out.fill(PAD_VALUE)
+    # Copie unique dans le tampon, avec inversion RGB -> BGR (format attendu par Ultralytics)
+    out[top:top + new_size[1], left:left + new_size[0]] = np.asarray(image)[:, :, ::-1]
+
+    scale = new_size[0] / original_size[0]
+    if timings is not None:
+        timings.record("letterbox", (time.perf_counter() - start) * 1000)
+    return Prepared(out, image, scale, (left, top), original_size)
+
+
+def downscale(prepared, imgsz, out=None):
+    """Letterbox à une taille inférieure à partir d'une image déjà préparée, sans redécoder la source"""
+    image = prepared.display
+    ratio = imgsz / max(image.size)
+    new_size = (max(1, round(image.size[0] * ratio)), max(1, round(image.size[1] * ratio)))
+    if new_size != image.size:
+        image = image.resize(new_size, Image.BILINEAR)
+    if out is None:
+        out = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    left = (imgsz - new_size[0]) // 2
+    top = (imgsz - new_size[1]) // 2
+    out.fill(PAD_VALUE)
+    out[top:top + new_size[1], left:left + new_size[0]] = np.asarray(image)[:, :, ::-1]
+    return Prepared(out, image, new_size[0] / prepared.original_size[0], (left, top), prepared.original_size)
+
+
+def crop_padding(array, prepared):
+    """Retire les bandes de letterbox d'une image de même taille que le tampon (ex. r.plot())"""
+    left, top = prepared.pad
+    width, height = prepared.display.size
+    return array[top:top + height, left:left + width]
+
+
+def map_boxes(detections, prepared):
+    """Ramène les boîtes du repère letterbox vers les coordonnées de l'image d'origine"""
+    left, top = prepared.pad
+    width, height = prepared.original_size
+    for det in detections:
+        x1, y1, x2, y2 = det["box"]
+        det["box"] = [
+            min(max((x1 - left) / prepared.scale, 0.0), width),
+            min(max((y1 - top) / prepared.scale, 0.0), height),
+            min(max((x2 - left) / prepared.scale, 0.0), width),
+            min(max((y2 - top) / prepared.scale, 0.0), height),
+        ]
+    return detections
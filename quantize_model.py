@@ -0,0 +1,86 @@
+"""Quantification INT8 post-entraînement, avec contrôle de précision avant publication.
+
+Les poids sont quantifiés via OpenVINO/NNCF en calibrant sur un échantillon des
+images d'entraînement, puis revalidés sur le split de validation. Le modèle INT8
+n'est publié dans `models/` que si son mAP50 reste à moins de `--max-drop` de la
+meilleure époque FP32 enregistrée dans `results.csv`.
+
+Utilisation :
+    python quantize_model.py --fraction 0.2 --max-drop 0.02
+"""
+import argparse
+import csv
+import os
+import shutil
+
+from ultralytics import YOLO
+
+import detection
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+RESULTS_CSV = "runs/detect/trash_detector/results.csv"
+WORK_DIR = "runs/quantize"
+
+
+def baseline_map50(results_csv=RESULTS_CSV):
+    """mAP50 de l'époque retenue comme best.pt (même critère de fitness qu'Ultralytics)"""
+    best_row, best_fitness = None, -1.0
+    with open(results_csv, newline="") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): v for k, v in row.items()}
+            fitness = 0.1 * float(row["metrics/mAP50(B)"]) + 0.9 * float(row["metrics/mAP50-95(B)"])
+            if fitness > best_fitness:
+                best_row, best_fitness = row, fitness
+    if best_row is None:
+        raise ValueError(f"Aucune époque dans {results_csv}")
+    return float(best_row["metrics/mAP50(B)"])
+
+
+def quantize(weights, data, fraction, imgsz, work_dir=WORK_DIR):
+    """Exporte une copie des poids en INT8 dans le dossier de travail et retourne son chemin"""
+    os.makedirs(work_dir, exist_ok=True)
+    work_weights = os.path.join(work_dir, os.path.basename(weights))
+    shutil.copy2(weights, work_weights)
+    model = YOLO(work_weights)
+    # Calibration sur un échantillon (fraction) des images d'entraînement
+    return model.export(format="openvino", int8=True, data=data, split="train",
+                        fraction=fraction, imgsz=imgsz, dynamic=True, device="cpu")
+
+
+def validate_map50(model_path, data, imgsz):
+    """mAP50 d'un modèle sur le split de validation"""
+    metrics = YOLO(model_path, task="detect").val(data=data, split="val", imgsz=imgsz,
+                                                 batch=1, device="cpu", plots=False)
+    return float(metrics.box.map50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantification INT8 avec contrôle de précision")
+    parser.add_argument("--weights", default=detection.MODEL_PATH)
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--results", default=RESULTS_CSV, help="results.csv de l'entraînement FP32")
+    parser.add_argument("--fraction", type=float, default=0.2,
+                        help="Part des images d'entraînement utilisée pour la calibration")
+    parser.add_argument("--imgsz", type=int, default=detection.DEFAULT_IMGSZ)
+    parser.add_argument("--max-drop", type=float, default=0.02,
+                        help="Baisse maximale de mAP50 tolérée (en absolu)")
+    args = parser.parse_args()
+
+    baseline = baseline_map50(args.results)
+    int8_path = quantize(args.weights, args.data, args.fraction, args.imgsz)
+    int8_map50 = validate_map50(int8_path, args.data, args.imgsz)
+    drop = baseline - int8_map50
+    print(f"📊 mAP50 FP32 : {baseline:.4f} • INT8 : {int8_map50:.4f} • écart : {drop:+.4f}")
+
+    if drop > args.max_drop:
+        raise SystemExit(f"❌ Modèle INT8 refusé : baisse de mAP50 supérieure à {args.max_drop:.4f}")
+
+    target = detection.backend_path(args.weights, "int8")
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    shutil.copytree(int8_path, target)
+    print(f"✅ Modèle INT8 publié : {target}")
+
+
+if __name__ == "__main__":
+    main()
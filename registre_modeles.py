@@ -0,0 +1,163 @@
+"""Registre des modèles disponibles dans `models/`.
+
+Découvre les poids (.pt de différentes tailles, exports ONNX et OpenVINO),
+les charge à la demande et ne les recharge que si leur contenu a changé.
+Les modèles déjà chargés restent en mémoire : changer de modèle ne recharge
+pas ceux qui sont déjà prêts.
+"""
+import json
+import os
+import threading
+
+import detection
+from cache_resultats import file_hash, file_signature
+
+MODELS_DIR = "models"
+CHUNK_SIZE = 1 << 20
+
+
+def _backend_for(name):
+    if name.endswith("_int8_openvino_model"):
+        return "int8"
+    if name.endswith("_openvino_model"):
+        return "openvino"
+    if name.endswith(".onnx"):
+        return "onnx"
+    if name.endswith(".pt"):
+        return "pytorch"
+    return None
+
+
+def pytorch_source(path, backend):
+    """Poids .pt dont un export est issu (inverse de `detection.backend_path`)"""
+    path = os.path.normpath(path)
+    suffix = {"onnx": ".onnx", "openvino": "_openvino_model", "int8": "_int8_openvino_model"}.get(backend)
+    return path[:-len(suffix)] + ".pt" if suffix and path.endswith(suffix) else path
+
+
+def load_weights_with_backend(path):
+    """(modèle, backend effectif) pour un fichier ou dossier de poids.
+
+    Passe par `detection.load_model_with_backend` : un export est validé par une
+    prédiction à vide, et un export défectueux retombe sur le .pt voisin.
+    """
+    backend = _backend_for(os.path.basename(os.path.normpath(path)))
+    model, loaded = detection.load_model_with_backend(pytorch_source(path, backend), backend)
+    if model is None:
+        raise RuntimeError(f"poids inutilisables et aucun .pt de repli : {path}")
+    return model, loaded
+
+
+def load_weights(path):
+    """Instance YOLO pour un fichier ou dossier de poids"""
+    return load_weights_with_backend(path)[0]
+
+
+class ModelEntry:
+    """Un fichier (ou dossier) de poids et le modèle chargé correspondant"""
+
+    def __init__(self, name, path, backend):
+        self.name = name
+        self.path = path
+        self.backend = backend
+        # Backend réellement chargé : "pytorch" si l'export a échoué et que le .pt a pris le relais
+        self.loaded_backend = None
+        self.model = None
+        self.signature = None
+        self.hash = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def size_bytes(self):
+        if self.is_file:
+            return os.path.getsize(self.path)
+        return sum(os.path.getsize(os.path.join(root, f))
+                   for root, _, files in os.walk(self.path) for f in files)
+
+    def metadata(self):
+        """Mesures publiées avec les poids (`<nom>.json` : mAP, latence CPU...), ou {}"""
+        path = os.path.splitext(os.path.normpath(self.path))[0] + ".json"
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+
+class ModelRegistry:
+    """Chargement paresseux et rechargement à chaud des modèles d'un dossier"""
+
+    def __init__(self, models_dir=MODELS_DIR):
+        self.models_dir = models_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def discover(self):
+        """Met à jour la liste des poids présents dans le dossier et la retourne"""
+        found = {}
+        if os.path.isdir(self.models_dir):
+            for entry in os.scandir(self.models_dir):
+                backend = _backend_for(entry.name)
+                if backend is None or entry.is_dir() != (backend in ("openvino", "int8")):
+                    continue
+                found[entry.name] = (entry.path, backend)
+        with self._lock:
+            for name in list(self._entries):
+                if name not in found:
+                    del self._entries[name]
+            for name, (path, backend) in found.items():
+                if name not in self._entries:
+                    self._entries[name] = ModelEntry(name, path, backend)
+            return sorted(self._entries.values(), key=lambda e: e.name)
+
+    def entry(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            self.discover()
+            with self._lock:
+                entry = self._entries.get(name)
+        return entry
+
+    def get(self, name):
+        """Modèle prêt à l'emploi ; (re)chargé seulement si son contenu a changé"""
+        entry = self.entry(name)
+        if entry is None:
+            return None
+        with entry.lock:
+            signature = file_signature(entry.path)
+            if entry.model is not None and signature == entry.signature:
+                return entry.model
+            # Date modifiée : on ne recharge que si l'empreinte du contenu a changé
+            current_hash = file_hash(entry.path)
+            if entry.model is None or current_hash != entry.hash:
+                entry.model, entry.loaded_backend = load_weights_with_backend(entry.path)
+            entry.signature = signature
+            entry.hash = current_hash
+            return entry.model
+
+    def loaded(self):
+        """Noms des modèles déjà chargés en mémoire"""
+        with self._lock:
+            return [name for name, e in self._entries.items() if e.model is not None]
+
+    def iter_chunks(self, name, chunk_size=CHUNK_SIZE):
+        """Lit un fichier de poids par blocs, pour le servir sans le charger entièrement en mémoire"""
+        entry = self.entry(name)
+        if entry is None or not entry.is_file:
+            raise FileNotFoundError(name)
+        with open(entry.path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+
+def default_model_name(registry, path=detection.MODEL_PATH, backend=None):
+    """Nom du modèle à présélectionner : export du backend configuré s'il existe, sinon best.pt"""
+    names = [e.name for e in registry.discover()]
+    preferred = os.path.basename(detection.backend_path(path, backend or detection.default_backend()))
+    for name in (preferred, os.path.basename(path)):
+        if name in names:
+            return name
+    return names[0] if names else None
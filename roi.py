@@ -0,0 +1,182 @@
+"""Zones d'intérêt (ROI) par source, pour les caméras fixes.
+
+Chaque source de `config/cameras.json` peut déclarer des zones sous la clé
+`roi`, en coordonnées normalisées (0 à 1) pour ne pas dépendre de la
+résolution : `{"cam-parking": {"roi": [[0.1, 0.4, 0.5, 0.95]]}}`. Seules ces
+zones passent dans le détecteur. Chacune est découpée à l'échelle qu'aurait
+l'image entière à `imgsz`, puis posée sur son propre canevas (arrondi au
+multiple de 32, sans redimensionnement par Ultralytics). Les découpes de même
+forme sont analysées en un seul lot, si bien que le coût suit l'aire des
+zones. Si la somme des canevas dépasse celle de l'image entière, une seule
+passe sur l'image entière est moins chère : elle est faite, et seules les
+détections centrées dans une zone sont gardées. Les boîtes sont ramenées dans
+le repère de l'image entière et limitées à leur zone. Les détections des zones
+qui se recouvrent sont fusionnées par NMS.
+"""
+import hashlib
+import json
+import math
+import os
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import detection
+from cascade import CAMERAS_CONFIG
+from pretraitement import PAD_VALUE, map_boxes
+from tuilage import merge_detections
+
+ROI_STRIDE = 32
+
+# Même interface que `pretraitement.Prepared` pour `map_boxes` et le micro-batcher ;
+# `zones` sont les zones couvertes par la découpe, dans le repère de l'image d'origine
+RoiCrop = namedtuple("RoiCrop", ["array", "scale", "pad", "original_size", "zones"])
+
+
+def load_camera_rois(path=CAMERAS_CONFIG):
+    """Zones d'intérêt par source : {source: [[x1, y1, x2, y2] normalisés, ...]}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cameras = json.load(f)
+    return {camera: conf["roi"] for camera, conf in cameras.items() if conf.get("roi")}
+
+
+def save_camera_rois(camera, rois, path=CAMERAS_CONFIG):
+    """Enregistre (ou efface si `rois` est vide) les zones d'une source, sans toucher aux autres clés"""
+    cameras = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            cameras = json.load(f)
+    conf = cameras.setdefault(camera, {})
+    if rois:
+        conf["roi"] = [[round(min(max(float(v), 0.0), 1.0), 4) for v in roi] for roi in rois]
+    else:
+        conf.pop("roi", None)
+        if not conf:
+            del cameras[camera]
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Écriture atomique : l'application relit le fichier à chaque exécution (le service, à son démarrage)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cameras, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def rois_digest(rois):
+    """Empreinte courte (12 caractères hexadécimaux) des zones, pour les clés de cache et les noms de fichier"""
+    canonical = json.dumps([[round(float(v), 4) for v in roi] for roi in rois], separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def roi_pixels(rois, width, height):
+    """Zones en pixels entiers, bornées à l'image ; les zones vides sont ignorées"""
+    boxes = []
+    for x1, y1, x2, y2 in rois:
+        left, right = sorted((int(math.floor(x1 * width)), int(math.ceil(x2 * width))))
+        top, bottom = sorted((int(math.floor(y1 * height)), int(math.ceil(y2 * height))))
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, width), min(bottom, height)
+        if right > left and bottom > top:
+            boxes.append((left, top, right, bottom))
+    return boxes
+
+
+def roi_fraction(rois):
+    """Part de l'image couverte par l'union des zones"""
+    if not rois:
+        return 1.0
+    xs = sorted({v for roi in rois for v in (roi[0], roi[2])})
+    ys = sorted({v for roi in rois for v in (roi[1], roi[3])})
+    area = 0.0
+    for x_lo, x_hi in zip(xs, xs[1:]):
+        for y_lo, y_hi in zip(ys, ys[1:]):
+            if any(r[0] <= x_lo and x_hi <= r[2] and r[1] <= y_lo and y_hi <= r[3] for r in rois):
+                area += (x_hi - x_lo) * (y_hi - y_lo)
+    return min(area, 1.0)
+
+
+def canvas_shape(height, width):
+    """Canevas (hauteur, largeur) au multiple de 32 contenant une découpe redimensionnée"""
+    return (math.ceil(max(1, round(height)) / ROI_STRIDE) * ROI_STRIDE,
+            math.ceil(max(1, round(width)) / ROI_STRIDE) * ROI_STRIDE)
+
+
+def prepare_rois(frame, rois, imgsz=detection.DEFAULT_IMGSZ, scale=1.0, original_size=None):
+    """Découpes des zones à l'échelle d'inférence, chacune sur son propre canevas.
+
+    `frame` peut être une version déjà réduite de l'image d'origine (facteur
+    `scale`, taille d'origine `original_size`) : les boîtes sont alors ramenées
+    directement dans le repère d'origine. Retourne une seule découpe de l'image
+    entière si elle coûte moins cher que la somme des zones.
+    """
+    height, width = frame.shape[:2]
+    original_size = original_size or (width, height)
+    ratio = imgsz / max(width, height)
+    boxes = roi_pixels(rois, width, height)
+    if not boxes:
+        return []
+    zones = [tuple(v / scale for v in box) for box in boxes]
+    shapes = [canvas_shape((bottom - top) * ratio, (right - left) * ratio) for left, top, right, bottom in boxes]
+    full_shape = canvas_shape(height * ratio, width * ratio)
+    if sum(h * w for h, w in shapes) >= full_shape[0] * full_shape[1]:
+        regions = [((0, 0, width, height), zones, full_shape)]
+    else:
+        regions = [(box, [zone], shape) for box, zone, shape in zip(boxes, zones, shapes)]
+
+    crops = []
+    for (left, top, right, bottom), region_zones, (canvas_height, canvas_width) in regions:
+        crop = frame[top:bottom, left:right]
+        size = (max(1, round((right - left) * ratio)), max(1, round((bottom - top) * ratio)))
+        if size != (right - left, bottom - top):
+            crop = np.asarray(Image.fromarray(crop).resize(size, Image.BILINEAR))
+        canvas = np.full((canvas_height, canvas_width, 3), PAD_VALUE, dtype=np.uint8)
+        canvas[:crop.shape[0], :crop.shape[1]] = crop
+        crops.append(RoiCrop(canvas, ratio * scale, (-left * ratio, -top * ratio), original_size, region_zones))
+    return crops
+
+
+def merge_roi_detections(crops, detections_per_crop):
+    """Boîtes centrées dans une zone, limitées à cette zone, puis fusionnées entre zones qui se recouvrent"""
+    merged = []
+    for crop, detections in zip(crops, detections_per_crop):
+        for det in detections:
+            x1, y1, x2, y2 = det["box"]
+            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+            zone = next((z for z in crop.zones if z[0] <= cx <= z[2] and z[1] <= cy <= z[3]), None)
+            if zone is None:
+                continue
+            x_min, y_min, x_max, y_max = zone
+            det["box"] = [min(max(x1, x_min), x_max), min(max(y1, y_min), y_max),
+                          min(max(x2, x_min), x_max), min(max(y2, y_min), y_max)]
+            if det["box"][2] > det["box"][0] and det["box"][3] > det["box"][1]:
+                merged.append(det)
+    return merge_detections(merged) if len(crops) > 1 else merged
+
+
+def predict_rois(model, frame, rois, conf=detection.DEFAULT_CONF, imgsz=detection.DEFAULT_IMGSZ,
+                 scale=1.0, original_size=None):
+    """Détections des seules zones d'intérêt, une passe par forme de canevas, dans le repère d'origine"""
+    crops = prepare_rois(frame, rois, imgsz, scale, original_size)
+    groups = defaultdict(list)
+    for i, crop in enumerate(crops):
+        groups[crop.array.shape[:2]].append(i)
+    detections = [None] * len(crops)
+    for shape, indices in groups.items():
+        results = detection.predict(model, [crops[i].array for i in indices], conf=conf, imgsz=list(shape))
+        for i, r in zip(indices, results):
+            detections[i] = map_boxes(detection.extract_detections(model, r), crops[i])
+    return merge_roi_detections(crops, detections)
+
+
+def draw_rois(image_rgb, rois, color=(52, 152, 219)):
+    """Contour des zones d'intérêt sur une image d'affichage (sans OpenCV)"""
+    height, width = image_rgb.shape[:2]
+    image = Image.fromarray(image_rgb)
+    draw = ImageDraw.Draw(image)
+    for left, top, right, bottom in roi_pixels(rois, width, height):
+        draw.rectangle((left, top, right - 1, bottom - 1), outline=color, width=2)
+    image_rgb[:] = np.asarray(image)
+    return image_rgb
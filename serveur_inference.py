@@ -0,0 +1,357 @@
+"""Service d'inférence HTTP/JSON avec regroupement dynamique en micro-lots.
+
+Les requêtes concurrentes sont placées dans une file ; un thread unique les
+regroupe en lots (taille maximale ou délai maximal atteint) et lance une seule
+passe du modèle par lot.
+
+Utilisation :
+    python serveur_inference.py --port 8000 --max-batch 16 --max-wait-ms 10
+
+    curl -X POST --data-binary @image.jpg http://localhost:8000/predict
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import detection
+from pretraitement import map_boxes, prepare
+from instrumentation import METRICS, Timings
+from cascade import bin_detections, classify_detections, decode_for_crops, load_camera_bins, load_classifier
+from cache_resultats import ResultCache, file_hash, file_signature
+from registre_modeles import MODELS_DIR, ModelRegistry
+from gating import CameraGates
+from historique import HistoryStore
+from roi import load_camera_rois, merge_roi_detections, prepare_rois, rois_digest
+
+
+class QueueFullError(Exception):
+    """La file d'attente du service est saturée"""
+
+
+class MicroBatcher:
+    """Regroupe les requêtes concurrentes en micro-lots pour le modèle.
+
+    Avec `model_path`, le modèle est rechargé par `refresh()` quand ses poids
+    changent ; `model_hash` est l'empreinte des poids réellement en service.
+    """
+
+    def __init__(self, model, max_batch=16, max_wait=0.01, max_queue=256,
+                 conf=detection.DEFAULT_CONF, imgsz=detection.DEFAULT_IMGSZ,
+                 model_path=None, backend=None, loaded_backend=None):
+        self.model = model
+        self.model_path = model_path
+        self.backend = backend
+        self.loaded_backend = loaded_backend or "pytorch"
+        self.model_hash = file_hash(self._loaded_path()) if model_path else None
+        self._signature = file_signature(self._loaded_path()) if model_path else None
+        self._reload_lock = threading.Lock()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.conf = conf
+        self.imgsz = imgsz
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def _loaded_path(self):
+        return detection.backend_path(self.model_path, self.loaded_backend)
+
+    def refresh(self):
+        """Recharge le modèle si ses poids ont changé ; retourne l'empreinte du modèle en service"""
+        if not self.model_path:
+            return self.model_hash
+        try:
+            if file_signature(self._loaded_path()) == self._signature:
+                return self.model_hash
+        except OSError:
+            # Poids en cours de remplacement : le modèle courant reste en service
+            return self.model_hash
+        with self._reload_lock:
+            try:
+                signature = file_signature(self._loaded_path())
+            except OSError:
+                return self.model_hash
+            if signature != self._signature and file_hash(self._loaded_path()) != self.model_hash:
+                model, backend = detection.load_model_with_backend(self.model_path, self.backend)
+                if model is not None:
+                    self.model, self.loaded_backend = model, backend
+                    self.model_hash = file_hash(self._loaded_path())
+                    signature = file_signature(self._loaded_path())
+                    print(f"🔄 Modèle rechargé ({detection.BACKEND_LABELS[backend]})", flush=True)
+            self._signature = signature
+        return self.model_hash
+
+    def submit(self, prepared, timings=None):
+        """Ajoute une image préparée à la file et retourne un Future sur ses détections"""
+        future = Future()
+        try:
+            self._queue.put_nowait((prepared, future, timings))
+        except queue.Full:
+            raise QueueFullError("file d'attente saturée")
+        return future
+
+    def pending(self):
+        """Nombre de requêtes en attente dans la file"""
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Une passe par taille d'entrée : images entières (imgsz) et canevas de zones d'intérêt
+            groups = defaultdict(list)
+            collected = self._collect()
+            # Un même modèle pour tout le lot, même si `refresh()` le remplace entre-temps
+            model = self.model
+            for item in collected:
+                groups[item[0].array.shape[:2]].append(item)
+            for shape, batch in groups.items():
+                imgsz = self.imgsz if shape == (self.imgsz, self.imgsz) else list(shape)
+                try:
+                    results = detection.predict(model, [p.array for p, _, _ in batch],
+                                                conf=self.conf, imgsz=imgsz)
+                except Exception as e:
+                    for _, future, _ in batch:
+                        future.set_exception(e)
+                    continue
+                for (prepared, future, timings), r in zip(batch, results):
+                    if timings is not None:
+                        timings.record_yolo(r)
+                    future.set_result(map_boxes(detection.extract_detections(model, r), prepared))
+
+
+def make_handler(batcher, timeout, cache=None, registry=None, classifier=None, camera_bins=None, gates=None,
+                 history=None, rois=None):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = METRICS.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == "/health":
+                payload = {"status": "ok", "queue": batcher.pending()}
+                if cache:
+                    payload["cache"] = cache.stats()
+                if gates:
+                    payload["gating"] = {camera: gate.stats() for camera, gate in gates.items()}
+                self._send_json(200, payload)
+            elif self.path == "/modeles" and registry:
+                self._send_json(200, {"modeles": [
+                    {"nom": e.name, "backend": e.backend, "taille": e.size_bytes()}
+                    for e in registry.discover()
+                ]})
+            elif self.path.startswith("/modeles/") and registry:
+                self._send_model(self.path[len("/modeles/"):])
+            else:
+                self._send_json(404, {"error": "route inconnue"})
+
+        def _send_model(self, name):
+            # Envoi par blocs : le fichier de poids n'est jamais chargé entièrement en mémoire
+            entry = registry.entry(name)
+            if entry is None or not entry.is_file:
+                self._send_json(404, {"error": f"modèle inconnu : {name}"})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(entry.size_bytes()))
+            self.send_header("Content-Disposition", f'attachment; filename="{entry.name}"')
+            self.end_headers()
+            for chunk in registry.iter_chunks(name):
+                self.wfile.write(chunk)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/predict":
+                self._send_json(404, {"error": "route inconnue"})
+                return
+            camera = parse_qs(url.query).get("camera", [None])[0]
+            bins = camera_bins.get(camera) if classifier and camera_bins else None
+            # Une porte par caméra : la scène de référence est propre à chaque flux
+            gate = gates[camera] if gates is not None and camera and not bins else None
+            camera_rois = rois.get(camera) if rois and not bins else None
+            reused = False
+            length = int(self.headers.get("Content-Length", 0))
+            data = self.rfile.read(length)
+            start = time.perf_counter()
+            timings = Timings()
+
+            # Clé construite sur l'empreinte du modèle réellement en service (rechargé si best.pt a changé)
+            model_hash = batcher.refresh()
+            kind = f"roi-{rois_digest(camera_rois)}" if camera_rois else "detections"
+            cache_key = (cache.key(data, batcher.conf, batcher.imgsz, kind=kind, model_hash=model_hash)
+                         if cache and not bins else None)
+            detections = cache.get(cache_key) if cache_key else None
+            cached = detections is not None
+            if cached and not classifier:
+                if history:
+                    history.record(camera, detections)
+                self._send_json(200, {
+                    "detections": detections,
+                    "cached": True,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                })
+                return
+            try:
+                # Tampon propre à la requête : il reste en file jusqu'au passage du lot
+                image = prepare(io.BytesIO(data), batcher.imgsz,
+                                out=np.empty((batcher.imgsz, batcher.imgsz, 3), dtype=np.uint8),
+                                timings=timings)
+            except Exception as e:
+                self._send_json(400, {"error": f"image illisible: {e}"})
+                return
+
+            def infer(_=None):
+                if not camera_rois:
+                    return batcher.submit(image, timings).result(timeout=timeout)
+                # Seules les zones d'intérêt de la caméra passent dans le modèle
+                crops = prepare_rois(np.ascontiguousarray(np.asarray(image.display)[:, :, ::-1]), camera_rois,
+                                     batcher.imgsz, image.scale, image.original_size)
+                futures = [batcher.submit(crop, timings) for crop in crops]
+                # Un seul délai pour toute la requête, quel que soit le nombre de zones
+                deadline = time.monotonic() + timeout
+                return merge_roi_detections(
+                    crops, [f.result(timeout=max(0.0, deadline - time.monotonic())) for f in futures])
+
+            if bins:
+                # Caméra fixe aux emplacements connus : pas de passe YOLO
+                detections = bin_detections(bins)
+            elif not cached:
+                try:
+                    if gate:
+                        detections, reused = gate.process(image.array, infer)
+                        detections = [dict(d) for d in detections]
+                    else:
+                        detections = infer()
+                except QueueFullError as e:
+                    self._send_json(503, {"error": str(e)})
+                    return
+                except Exception as e:
+                    self._send_json(500, {"error": str(e)})
+                    return
+                if cache and not reused and batcher.model_hash == model_hash:
+                    cache.put(cache_key, detections)
+
+            if classifier and detections:
+                with timings.stage("fill_level"):
+                    # Découpes prises dans la source : l'image réduite à imgsz est trop petite pour le classifieur
+                    source, scale = decode_for_crops(io.BytesIO(data), detections, classifier.img_size)
+                    classify_detections(classifier, source, detections, scale)
+                    del source
+            if history and not reused:
+                history.record(camera, detections)
+            timings.record("total", (time.perf_counter() - start) * 1000)
+            METRICS.observe(timings)
+            self._send_json(200, {
+                "detections": detections,
+                "cached": cached,
+                "reused": reused,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service d'inférence YOLO avec micro-lots")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=detection.MODEL_PATH)
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="Dossier des poids servis sur /modeles")
+    parser.add_argument("--backend", choices=detection.BACKENDS, default=None,
+                        help="Backend d'inférence (par défaut : POUBELLE_BACKEND ou pytorch)")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--conf", type=float, default=detection.DEFAULT_CONF)
+    parser.add_argument("--imgsz", type=int, default=detection.DEFAULT_IMGSZ)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--cache-mb", type=int, default=256, help="0 pour désactiver le cache")
+    parser.add_argument("--cache-dir", default=None, help="Active le niveau disque du cache")
+    parser.add_argument("--cache-disk-mb", type=int, default=2048)
+    parser.add_argument("--fill-level", action="store_true",
+                        help="Ajoute le niveau de remplissage (cascade) ; ?camera=<id> saute YOLO si ses poubelles sont connues")
+    parser.add_argument("--gate-threshold", type=float, default=0.0,
+                        help="Réutilise les détections d'une caméra (?camera=<id>) tant que la scène change moins que ce seuil (0 = désactivé)")
+    parser.add_argument("--gate-method", choices=["diff", "phash"], default="diff")
+    parser.add_argument("--gate-interval", type=float, default=60.0, help="Rafraîchissement forcé par caméra (s)")
+    parser.add_argument("--gate-max-cameras", type=int, default=64,
+                        help="Nombre maximal de caméras suivies ; au-delà, la moins récemment vue est oubliée")
+    parser.add_argument("--no-roi", action="store_true",
+                        help="Ignore les zones d'intérêt de config/cameras.json (?camera=<id>) et analyse l'image entière")
+    parser.add_argument("--history-db", default=None,
+                        help="Enregistre les détections dans cette base SQLite (source = ?camera=<id>)")
+    args = parser.parse_args()
+
+    model, backend = detection.load_model_with_backend(args.model, args.backend)
+    if model is None:
+        raise SystemExit(f"❌ Modèle introuvable : {args.model}")
+    print(f"🧠 Backend d'inférence : {detection.BACKEND_LABELS[backend]}")
+
+    batcher = MicroBatcher(model, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000,
+                           max_queue=args.max_queue, conf=args.conf, imgsz=args.imgsz,
+                           model_path=args.model, backend=args.backend, loaded_backend=backend)
+    cache = None
+    if args.cache_mb > 0:
+        cache = ResultCache(args.model, max_memory_bytes=args.cache_mb << 20,
+                            disk_dir=args.cache_dir, max_disk_bytes=args.cache_disk_mb << 20)
+    classifier, camera_bins = None, None
+    if args.fill_level:
+        classifier = load_classifier()
+        if classifier is None:
+            raise SystemExit("❌ Classifieur de remplissage indisponible (saved_models/fill_level.h5)")
+        camera_bins = load_camera_bins()
+    gates = None
+    if args.gate_threshold > 0:
+        gates = CameraGates(args.gate_max_cameras, args.gate_threshold, args.gate_method, args.gate_interval)
+    history = HistoryStore(args.history_db) if args.history_db else None
+    rois = {} if args.no_roi else load_camera_rois()
+    if rois:
+        print(f"🎯 Zones d'intérêt chargées pour {len(rois)} caméra(s)")
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(batcher, args.timeout, cache, ModelRegistry(args.models_dir), classifier,
+                                              camera_bins, gates, history, rois))
+    print(f"✅ Service d'inférence à l'écoute sur http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        if history:
+            history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Jeu d'entraînement pré-décodé en fragments NumPy mappés en mémoire.
+
+Avec `cache: false`, chaque époque redécode et redimensionne chaque JPEG sur
+le CPU. `build` letterboxe une fois pour toutes chaque image à la taille
+d'entraînement, par le même prétraitement que l'inférence (`pretraitement.py`).
+Les images sont écrites dans des fichiers `.npy` de forme (N, imgsz, imgsz, 3),
+et `index.json` donne pour chaque image son fragment, sa position et ses
+étiquettes, ramenées dans le repère letterbox. `train` entraîne directement
+depuis ces fragments : le dataloader lit les fichiers en `mmap` (lecture
+seule), si bien que plusieurs entraînements simultanés partagent le même cache
+de pages du noyau au lieu de garder chacun une copie en RAM. Les augmentations
+(mosaïque, HSV, retournement, ...) restent appliquées à la volée par
+Ultralytics. Elles portent sur l'image letterboxée, bandes grises comprises :
+contrairement à `train_yolo.py`, qui charge l'image à son rapport d'aspect,
+la mosaïque et les transformations géométriques voient aussi ces bandes.
+
+Utilisation :
+    python shards.py build --imgsz 640
+    python shards.py train --model yolov8n.pt --epochs 50 --name trash_detector
+"""
+import argparse
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from donnees import label_path, list_split, read_labels
+from pretraitement import prepare
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+SHARDS_DIR = "datasets/shards"
+SHARD_SIZE = 1024
+INDEX_FILE = "index.json"
+
+
+def letterbox_labels(labels, prepared, imgsz):
+    """Étiquettes normalisées sur l'image d'origine -> normalisées sur l'image letterboxée"""
+    left, top = prepared.pad
+    width, height = prepared.display.size
+    out = labels.copy()
+    out[:, 1] = (left + labels[:, 1] * width) / imgsz
+    out[:, 2] = (top + labels[:, 2] * height) / imgsz
+    out[:, 3] = labels[:, 3] * width / imgsz
+    out[:, 4] = labels[:, 4] * height / imgsz
+    return out
+
+
+def _load(path, imgsz):
+    try:
+        prepared = prepare(path, imgsz, out=np.empty((imgsz, imgsz, 3), dtype=np.uint8))
+    except (OSError, ValueError):
+        return path, None, None
+    labels = letterbox_labels(read_labels(label_path(path)), prepared, imgsz)
+    return path, prepared.array, labels
+
+
+def _prepared(images, imgsz, workers):
+    """Images letterboxées dans l'ordre, décodées en parallèle avec un nombre borné d'images en vol"""
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for path in images:
+            pending.append(executor.submit(_load, path, imgsz))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build_split(images, out_dir, imgsz, shard_size=SHARD_SIZE, workers=None):
+    """Écrit les fragments d'un split et son index ; retourne le nombre d'images écrites"""
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    shards, entries, skipped = [], [], []
+    shard = None
+    for i, (path, array, labels) in enumerate(_prepared(images, imgsz, workers)):
+        if array is None:
+            skipped.append(path)
+            continue
+        shard_id, offset = divmod(len(entries), shard_size)
+        if offset == 0:
+            if shard is not None:
+                shard.flush()
+            # Capacité = images restantes : suffisante même si des images illisibles sont ignorées
+            capacity = min(shard_size, len(images) - i)
+            name = f"shard_{shard_id:05d}.npy"
+            shard = np.lib.format.open_memmap(os.path.join(out_dir, name), mode="w+", dtype=np.uint8,
+                                              shape=(capacity, imgsz, imgsz, 3))
+            shards.append({"file": name, "count": 0})
+        shard[offset] = array
+        shards[-1]["count"] += 1
+        entries.append({"path": path, "shard": shard_id, "offset": offset,
+                        "labels": np.round(labels, 6).tolist()})
+    if shard is not None:
+        shard.flush()
+        del shard
+
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump({"imgsz": imgsz, "shards": shards, "images": entries, "skipped": skipped}, f)
+    if skipped:
+        print(f"⚠️ {len(skipped)} image(s) illisible(s) ignorée(s) dans {out_dir} (liste dans {INDEX_FILE}) :")
+        for path in skipped:
+            print(f"   {path}")
+    return len(entries)
+
+
+def build(data=DATA_PATH, out_dir=SHARDS_DIR, imgsz=640, shard_size=SHARD_SIZE, workers=None):
+    """Fragments des splits train et val, et un data.yaml qui pointe vers eux"""
+    from ultralytics.data.utils import check_det_dataset
+
+    base = check_det_dataset(data)
+    splits = {}
+    for split in ("train", "val"):
+        split_dir = os.path.abspath(os.path.join(out_dir, split))
+        n_images = build_split(list_split(base[split]), split_dir, imgsz, shard_size, workers)
+        print(f"📦 {split} : {n_images} images -> {split_dir}")
+        splits[split] = split_dir
+
+    data_yaml = os.path.join(out_dir, "data.yaml")
+    with open(data_yaml, "w") as f:
+        yaml.safe_dump({**splits, "nc": base["nc"], "names": base["names"]}, f, allow_unicode=True)
+    return data_yaml
+
+
+def read_index(split_dir):
+    with open(os.path.join(split_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+class ShardDataset(YOLODataset):
+    """YOLODataset dont les images sont lues dans les fragments mappés en mémoire"""
+
+    def get_img_files(self, img_path):
+        self.index = read_index(img_path)
+        if self.index["imgsz"] != self.imgsz:
+            raise ValueError(f"Fragments construits à {self.index['imgsz']} px, entraînement demandé à {self.imgsz} px")
+        entries = self.index["images"]
+        if self.fraction < 1:
+            entries = entries[:round(len(entries) * self.fraction)]
+        # Ultralytics réordonne les images (mode rect) : la position est retrouvée par le chemin
+        self.locations = {e["path"]: (e["shard"], e["offset"]) for e in entries}
+        self._shards = {}
+        return [e["path"] for e in entries]
+
+    def get_labels(self):
+        labels = []
+        for e in self.index["images"][:len(self.im_files)]:
+            boxes = np.array(e["labels"], dtype=np.float32).reshape(-1, 5)
+            labels.append({
+                "im_file": e["path"],
+                "shape": (self.imgsz, self.imgsz),
+                "cls": boxes[:, :1],
+                "bboxes": boxes[:, 1:],
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def _shard(self, shard_id):
+        # Ouverture paresseuse dans chaque processus du dataloader
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            path = os.path.join(self.img_path, self.index["shards"][shard_id]["file"])
+            shard = self._shards[shard_id] = np.load(path, mmap_mode="r")
+        return shard
+
+    def load_image(self, i, rect_mode=True):
+        shard_id, offset = self.locations[self.im_files[i]]
+        # Copie : les augmentations modifient l'image, le fragment reste en lecture seule
+        image = np.array(self._shard(shard_id)[offset])
+        if self.augment:
+            # La mosaïque tire ses images dans ce tampon d'indices ; les pixels ne sont pas gardés en RAM
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return image, (self.imgsz, self.imgsz), (self.imgsz, self.imgsz)
+
+    def __getstate__(self):
+        # Un memmap sérialisé serait copié en entier vers chaque worker
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+
+class ShardTrainer(DetectionTrainer):
+    """Entraîneur de détection qui lit les splits depuis les fragments"""
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return ShardDataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=None,
+            single_cls=self.args.single_cls or False,
+            stride=gs,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fragments mappés en mémoire du jeu d'entraînement")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Décode et letterboxe le jeu dans des fragments .npy")
+    build_parser.add_argument("--data", default=DATA_PATH)
+    build_parser.add_argument("--out", default=SHARDS_DIR)
+    build_parser.add_argument("--imgsz", type=int, default=640)
+    build_parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Images par fragment")
+    build_parser.add_argument("--workers", type=int, default=None, help="Processus de décodage (défaut : nb de CPU)")
+
+    train_parser = commands.add_parser("train", help="Entraîne depuis les fragments")
+    train_parser.add_argument("--shards", default=SHARDS_DIR)
+    train_parser.add_argument("--model", default="yolov8n.pt")
+    train_parser.add_argument("--epochs", type=int, default=50)
+    train_parser.add_argument("--batch", type=int, default=8)
+    train_parser.add_argument("--workers", type=int, default=8)
+    train_parser.add_argument("--name", default="trash_detector")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        data_yaml = build(args.data, args.out, args.imgsz, args.shard_size, args.workers)
+        size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(args.out) for f in files)
+        print(f"✅ {data_yaml} ({size / 2 ** 30:.2f} Go)")
+        return
+
+    data_yaml = os.path.join(args.shards, "data.yaml")
+    with open(data_yaml) as f:
+        imgsz = read_index(yaml.safe_load(f)["train"])["imgsz"]
+    YOLO(args.model).train(
+        trainer=ShardTrainer,
+        data=data_yaml,
+        epochs=args.epochs,
+        imgsz=imgsz,
+        batch=args.batch,
+        workers=args.workers,
+        name=args.name,
+        pretrained=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Recherche d'hyperparamètres en parallèle, avec arrêt anticipé des essais peu prometteurs.
+
+Les essais tournent dans un pool de processus dimensionné sur les cœurs
+disponibles ; chaque essai est limité à `--threads-per-trial` threads pour ne
+pas surcharger le CPU. À chaque fin d'époque, un essai lit le mAP50-95 de son
+`results.csv` et s'arrête s'il est sous la médiane des autres essais à la même
+époque (règle d'arrêt médiane). Le classement final met en regard la précision
+et la latence d'inférence mesurée.
+
+Exemple d'espace de recherche (JSON ou YAML) :
+    {"epochs": [30], "imgsz": [480, 640], "batch": [8, 16],
+     "lr0": {"min": 0.001, "max": 0.02, "log": true}}
+
+Utilisation :
+    python sweep_hyperparams.py --space sweep.yaml --trials 12 --threads-per-trial 2
+"""
+import argparse
+import csv
+import glob
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+from donnees import limit_threads, list_split, measure_latency
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+SWEEP_DIR = "runs/sweep"
+MAP_COLUMN = "metrics/mAP50-95(B)"
+
+
+def load_space(path):
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def sample_trials(space, n_trials, seed=0):
+    """Grille complète si tout est discret et --trials absent, sinon tirage aléatoire"""
+    discrete = all(isinstance(v, list) for v in space.values())
+    if discrete and not n_trials:
+        keys = list(space)
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(n_trials or 10):
+        params = {}
+        for key, spec in space.items():
+            if isinstance(spec, list):
+                params[key] = rng.choice(spec)
+            elif spec.get("log"):
+                params[key] = math.exp(rng.uniform(math.log(spec["min"]), math.log(spec["max"])))
+            else:
+                params[key] = rng.uniform(spec["min"], spec["max"])
+        trials.append(params)
+    return trials
+
+
+def read_map_curve(results_csv):
+    """mAP50-95 par époque lu dans un results.csv"""
+    if not os.path.exists(results_csv):
+        return []
+    with open(results_csv, newline="") as f:
+        return [float({k.strip(): v for k, v in row.items()}[MAP_COLUMN]) for row in csv.DictReader(f)]
+
+
+def should_stop(own_csv, sweep_dir, grace_epochs, min_peers):
+    """Règle d'arrêt médiane : sous la médiane des autres essais à la même époque"""
+    own = read_map_curve(own_csv)
+    epoch = len(own)
+    if epoch <= grace_epochs:
+        return False
+    peers = []
+    for other_csv in glob.glob(os.path.join(sweep_dir, "*", "results.csv")):
+        if os.path.samefile(other_csv, own_csv):
+            continue
+        curve = read_map_curve(other_csv)
+        if len(curve) >= epoch:
+            peers.append(max(curve[:epoch]))
+    if len(peers) < min_peers:
+        return False
+    return max(own) < statistics.median(peers)
+
+
+def run_trial(index, params, data, sweep_dir, threads, grace_epochs, min_peers):
+    """Entraîne un essai ; exécuté dans un processus du pool"""
+    from ultralytics import YOLO
+
+    name = f"trial_{index:03d}"
+    model = YOLO(params.get("model", "yolov8n.pt"))
+
+    def early_stop(trainer):
+        own_csv = os.path.join(str(trainer.save_dir), "results.csv")
+        if should_stop(own_csv, sweep_dir, grace_epochs, min_peers):
+            print(f"✂️ {name} arrêté à l'époque {trainer.epoch + 1} (sous la médiane)")
+            trainer.stop = True
+
+    model.add_callback("on_fit_epoch_end", early_stop)
+    train_args = {k: v for k, v in params.items() if k != "model"}
+    model.train(data=data, project=sweep_dir, name=name, exist_ok=True,
+                workers=min(2, threads), plots=False, verbose=False, **train_args)
+    return name
+
+
+def leaderboard(sweep_dir, trials, images, threads):
+    rows = []
+    for index, params in enumerate(trials):
+        trial_dir = os.path.join(sweep_dir, f"trial_{index:03d}")
+        curve = read_map_curve(os.path.join(trial_dir, "results.csv"))
+        weights = os.path.join(trial_dir, "weights", "best.pt")
+        if not curve or not os.path.exists(weights):
+            continue
+        imgsz = params.get("imgsz", 640)
+        rows.append({
+            "trial": f"trial_{index:03d}",
+            **{k: params[k] for k in sorted(params)},
+            "epochs_run": len(curve),
+            MAP_COLUMN: round(max(curve), 5),
+            "latency/p50(ms)": round(measure_latency(weights, images, imgsz, threads), 2),
+        })
+    # Front de Pareto : aucun autre essai n'est à la fois plus précis et plus rapide
+    for row in rows:
+        accuracy, latency = row[MAP_COLUMN], row["latency/p50(ms)"]
+        row["pareto"] = not any(
+            other[MAP_COLUMN] >= accuracy and other["latency/p50(ms)"] <= latency
+            and (other[MAP_COLUMN] > accuracy or other["latency/p50(ms)"] < latency)
+            for other in rows
+        )
+    rows.sort(key=lambda r: (-r[MAP_COLUMN], r["latency/p50(ms)"]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche d'hyperparamètres en parallèle")
+    parser.add_argument("--space", required=True, help="Espace de recherche (JSON ou YAML)")
+    parser.add_argument("--data", default=DATA_PATH)
+    parser.add_argument("--trials", type=int, default=None, help="Nombre d'essais (défaut : grille complète)")
+    parser.add_argument("--threads-per-trial", type=int, default=2)
+    parser.add_argument("--grace-epochs", type=int, default=5, help="Époques avant toute décision d'arrêt")
+    parser.add_argument("--min-peers", type=int, default=2, help="Essais de comparaison requis pour arrêter")
+    parser.add_argument("--latency-images", type=int, default=16)
+    parser.add_argument("--name", default="sweep")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    trials = sample_trials(load_space(args.space), args.trials, args.seed)
+    sweep_dir = os.path.abspath(os.path.join(SWEEP_DIR, args.name))
+    os.makedirs(sweep_dir, exist_ok=True)
+    workers = max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+    print(f"🔬 {len(trials)} essais • {workers} en parallèle • {args.threads_per_trial} threads chacun")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=limit_threads, initargs=(args.threads_per_trial,)) as executor:
+        futures = {
+            executor.submit(run_trial, i, params, args.data, sweep_dir, args.threads_per_trial,
+                            args.grace_epochs, args.min_peers): i
+            for i, params in enumerate(trials)
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"✅ {future.result()} terminé")
+            except Exception as e:
+                print(f"❌ trial_{futures[future]:03d} en échec : {e}")
+
+    from ultralytics.data.utils import check_det_dataset
+
+    images = list_split(check_det_dataset(args.data)["val"])[:args.latency_images]
+    rows = leaderboard(sweep_dir, trials, images, args.threads_per_trial)
+    if not rows:
+        raise SystemExit("❌ Aucun essai exploitable")
+
+    output = os.path.join(sweep_dir, "leaderboard.csv")
+    fields = list(dict.fromkeys(k for row in rows for k in row))
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    for rank, row in enumerate(rows, start=1):
+        mark = "⭐" if row["pareto"] else "  "
+        print(f"{mark} {rank:>2}. {row['trial']} mAP50-95={row[MAP_COLUMN]:.4f} "
+              f"p50={row['latency/p50(ms)']:.1f}ms époques={row['epochs_run']}")
+    print(f"📊 Classement : {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Ré-entraînement incrémental à partir de `models/best.pt`.
+
+Au lieu de repartir de `yolov8n.pt` pour 50 époques, on affine le modèle
+courant sur les images nouvellement annotées, mélangées à un échantillon
+(« replay ») des anciennes images d'entraînement pour ne pas oublier l'existant.
+L'entraînement reprend proprement après une interruption, respecte un budget
+de temps, met les images en cache (RAM ou disque) et choisit le nombre de
+workers du dataloader par une courte mesure.
+
+Utilisation :
+    python train_incremental.py --new-images nouveaux_lots/lot_07/images --time-budget 20
+    python train_incremental.py --resume --name incremental
+"""
+import argparse
+import os
+import random
+import time
+
+import yaml
+from ultralytics import YOLO
+
+import detection
+from donnees import list_images, list_split
+
+DATA_PATH = "detection_poubelle.v1i.yolov8/data.yaml"
+RUNS_DIR = "runs/detect"
+
+
+def build_dataset(data, new_images_dir, replay_fraction, work_dir, seed=0):
+    """Écrit un data.yaml : nouvelles images + échantillon des anciennes, validation inchangée"""
+    from ultralytics.data.utils import check_det_dataset
+
+    base = check_det_dataset(data)
+    new_images = list_images(new_images_dir)
+    if not new_images:
+        raise SystemExit(f"❌ Aucune image dans {new_images_dir}")
+    old_images = list_split(base["train"])
+    replay = random.Random(seed).sample(old_images, int(len(old_images) * replay_fraction))
+
+    os.makedirs(work_dir, exist_ok=True)
+    train_list = os.path.join(work_dir, "train.txt")
+    with open(train_list, "w") as f:
+        f.write("\n".join(new_images + replay) + "\n")
+
+    data_yaml = os.path.join(work_dir, "data.yaml")
+    with open(data_yaml, "w") as f:
+        yaml.safe_dump({
+            "train": os.path.abspath(train_list),
+            "val": base["val"],
+            "nc": base["nc"],
+            "names": base["names"],
+        }, f, allow_unicode=True)
+    print(f"📦 {len(new_images)} nouvelles images + {len(replay)} anciennes (replay)")
+    return data_yaml, len(new_images) + len(replay)
+
+
+def choose_cache(n_images, imgsz, mode):
+    """'ram' si les images redimensionnées tiennent largement en mémoire libre, sinon 'disk'"""
+    if mode != "auto":
+        return False if mode == "none" else mode
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return "disk"
+    needed = n_images * imgsz * imgsz * 3
+    return "ram" if needed < available * 0.5 else "disk"
+
+
+def _read_image(path):
+    import cv2
+    image = cv2.imread(path)
+    return 0 if image is None else image.shape[0]
+
+
+class _ImageList:
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        return _read_image(self.paths[i])
+
+
+def autotune_workers(images, batch, probe_batches=6):
+    """Nombre de workers donnant le meilleur débit de décodage sur un court échantillon"""
+    import torch.utils.data
+
+    sample = images[:batch * probe_batches]
+    cpu = os.cpu_count() or 1
+    candidates = sorted({0, 2, 4, 8, cpu} & set(range(cpu + 1)))
+    best_workers, best_rate = 0, 0.0
+    for workers in candidates:
+        loader = torch.utils.data.DataLoader(
+            _ImageList(sample), batch_size=batch, num_workers=workers, collate_fn=list
+        )
+        start = time.perf_counter()
+        for _ in loader:
+            pass
+        rate = len(sample) / (time.perf_counter() - start)
+        if rate > best_rate:
+            best_workers, best_rate = workers, rate
+    print(f"⚙️ Workers du dataloader : {best_workers} ({best_rate:.0f} img/s au décodage)")
+    return best_workers
+
+
+def last_checkpoint(name, runs_dir=RUNS_DIR):
+    path = os.path.join(runs_dir, name, "weights", "last.pt")
+    return path if os.path.exists(path) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ré-entraînement incrémental du détecteur")
+    parser.add_argument("--base", default=detection.MODEL_PATH, help="Poids de départ")
+    parser.add_argument("--data", default=DATA_PATH, help="Jeu de données d'origine")
+    parser.add_argument("--new-images", help="Dossier des nouvelles images (labels dans ../labels)")
+    parser.add_argument("--replay-fraction", type=float, default=0.2,
+                        help="Part des anciennes images d'entraînement rejouées")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="Budget de temps en minutes (prioritaire sur --epochs)")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--cache", choices=["auto", "ram", "disk", "none"], default="auto")
+    parser.add_argument("--workers", default="auto", help="Nombre de workers, ou 'auto'")
+    parser.add_argument("--name", default="incremental")
+    parser.add_argument("--resume", action="store_true", help="Reprend le dernier entraînement interrompu")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checkpoint = last_checkpoint(args.name)
+    if args.resume:
+        if checkpoint is None:
+            raise SystemExit(f"❌ Aucun entraînement à reprendre dans {RUNS_DIR}/{args.name}")
+        # Ultralytics restaure époque, optimiseur, budget de temps et arguments depuis last.pt
+        YOLO(checkpoint).train(resume=True)
+        return
+
+    if not args.new_images:
+        parser.error("--new-images est requis (sauf avec --resume)")
+
+    work_dir = os.path.join("runs", "incremental", args.name)
+    data_yaml, n_images = build_dataset(args.data, args.new_images, args.replay_fraction, work_dir, args.seed)
+    cache = choose_cache(n_images, args.imgsz, args.cache)
+    if args.workers == "auto":
+        with open(os.path.join(work_dir, "train.txt")) as f:
+            workers = autotune_workers([line.strip() for line in f], args.batch)
+    else:
+        workers = int(args.workers)
+
+    model = YOLO(args.base)
+    model.train(
+        data=data_yaml,
+        epochs=args.epochs,
+        time=args.time_budget / 60 if args.time_budget else None,
+        imgsz=args.imgsz,
+        batch=args.batch,
+        cache=cache,
+        workers=workers,
+        # Affinage : optimiseur fixé (le mode 'auto' ignorerait lr0), taux réduit et échauffement court
+        optimizer="AdamW",
+        lr0=0.001,
+        warmup_epochs=1,
+        name=args.name,
+        exist_ok=True,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Inférence par tuiles pour les images haute résolution (caméras 4K, grand angle).
+
+L'image pleine résolution est découpée en tuiles de 640 qui se chevauchent,
+analysées par lots, puis les boîtes sont replacées dans le repère de l'image
+et fusionnées de part et d'autre des bordures par une NMS. Une passe globale
+à basse résolution peut s'ajouter pour les objets plus grands qu'une tuile ;
+ses boîtes ne sont comparées aux autres qu'en IoU, pour qu'une grande boîte
+n'absorbe pas les petits objets qu'elle contient.
+"""
+import numpy as np
+from PIL import Image
+
+import detection
+
+
+def load_bgr(source):
+    """Décode une image en pleine résolution, au format BGR attendu par Ultralytics"""
+    return np.ascontiguousarray(np.asarray(Image.open(source).convert("RGB"))[:, :, ::-1])
+
+
+def _starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def make_tiles(width, height, tile=detection.DEFAULT_IMGSZ, overlap=0.2):
+    """Fenêtres (x0, y0, x1, y1) couvrant l'image ; la dernière tuile est calée sur le bord"""
+    step = max(1, int(tile * (1 - overlap)))
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in _starts(height, tile, step)
+        for x in _starts(width, tile, step)
+    ]
+
+
+def nms(boxes, scores, classes, threshold=0.5, metric="iou"):
+    """NMS par classe ; 'ios' (intersection / plus petite boîte) absorbe les boîtes coupées par une bordure"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        overlap = detection.box_iou(boxes[i:i + 1], boxes[rest], metric)[0]
+        suppressed = (overlap > threshold) & (classes[rest] == classes[i])
+        order = rest[~suppressed]
+    return np.array(keep, dtype=int)
+
+
+def merge_detections(detections, threshold=0.5, metric="iou"):
+    """Fusionne les détections de plusieurs tuiles (déjà dans le repère de l'image)"""
+    if not detections:
+        return []
+    boxes = np.array([d["box"] for d in detections], dtype=np.float32)
+    scores = np.array([d["confidence"] for d in detections], dtype=np.float32)
+    classes = np.array([d["class_id"] for d in detections])
+    return [detections[i] for i in nms(boxes, scores, classes, threshold, metric)]
+
+
+def predict_tiled(model, image_bgr, tile=detection.DEFAULT_IMGSZ, overlap=0.2, conf=detection.DEFAULT_CONF,
+                  batch_size=16, merge_threshold=0.5, include_full=True):
+    """Détections sur toutes les tuiles (et l'image entière), dans le repère de l'image d'origine"""
+    height, width = image_bgr.shape[:2]
+    windows = make_tiles(width, height, tile, overlap)
+    detections = []
+    for start in range(0, len(windows), batch_size):
+        chunk = windows[start:start + batch_size]
+        # Les tuiles sont des vues de l'image : aucune copie avant le letterbox d'Ultralytics
+        crops = [image_bgr[y0:y1, x0:x1] for x0, y0, x1, y1 in chunk]
+        for (x0, y0, _, _), r in zip(chunk, detection.predict(model, crops, conf=conf, imgsz=tile)):
+            for det in detection.extract_detections(model, r):
+                x1, y1, x2, y2 = det["box"]
+                det["box"] = [x1 + x0, y1 + y0, x2 + x0, y2 + y0]
+                detections.append(det)
+    # Entre tuiles, l'IoS recolle les objets coupés par une bordure
+    detections = merge_detections(detections, merge_threshold, metric="ios")
+    if include_full and len(windows) > 1:
+        r = detection.predict(model, image_bgr, conf=conf, imgsz=tile)[0]
+        # En IoS, une grande boîte de la passe globale supprimerait les petites boîtes des tuiles qu'elle contient
+        detections = merge_detections(detections + detection.extract_detections(model, r), merge_threshold)
+    return detections
+
+
+def draw_detections(image_rgb, detections, scale=1.0, color=(46, 204, 113)):
+    """Dessine les boîtes (coordonnées d'origine) sur une image d'affichage réduite d'un facteur `scale`"""
+    import cv2
+
+    for det in detections:
+        x1, y1, x2, y2 = (int(round(v * scale)) for v in det["box"])
+        cv2.rectangle(image_rgb, (x1, y1), (x2, y2), color, 2)
+        label = f"{det['class_name']} {det['confidence']:.2f}"
+        cv2.putText(image_rgb, label, (x1, max(y1 - 6, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return image_rgb
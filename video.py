@@ -0,0 +1,153 @@
+"""Analyse de fichiers vidéo et de flux caméra.
+
+Le décodage tourne dans un thread dédié qui ne décode qu'une image sur
+`stride` (les autres sont seulement sautées avec `grab`) ; l'inférence
+consomme ces images depuis une file bornée sans jamais attendre le décodeur
+plus que nécessaire.
+"""
+import queue
+import threading
+import time
+
+import cv2
+
+import detection
+from roi import predict_rois
+
+_END = object()
+
+
+class FrameReader(threading.Thread):
+    """Thread de décodage : place (index, horodatage, image BGR) dans une file bornée.
+
+    Pour un flux en direct (`live=True`), l'image la plus ancienne est abandonnée
+    quand la file est pleine, afin que l'inférence travaille toujours sur des
+    images récentes. Pour un fichier, le décodeur attend simplement l'inférence.
+    """
+
+    def __init__(self, source, stride=1, max_queue=8, live=False):
+        super().__init__(name="frame-reader", daemon=True)
+        self.source = source
+        self.stride = max(1, stride)
+        self.live = live
+        self.frames = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.fps = None
+        self.frame_count = None
+        self._stop_event = threading.Event()
+        self._opened = threading.Event()
+        self.error = None
+
+    def run(self):
+        capture = cv2.VideoCapture(self.source)
+        try:
+            if not capture.isOpened():
+                self.error = f"impossible d'ouvrir la source {self.source}"
+                return
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or None
+            count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.frame_count = count if count > 0 else None
+            self._opened.set()
+            index = 0
+            while not self._stop_event.is_set():
+                if index % self.stride:
+                    if not capture.grab():
+                        break
+                    index += 1
+                    continue
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                self._put((index, timestamp, frame))
+                index += 1
+        finally:
+            capture.release()
+            self._opened.set()
+            self._put(_END, force=True)
+
+    def _put(self, item, force=False):
+        while not self._stop_event.is_set() or force:
+            try:
+                self.frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.live or force:
+                    try:
+                        self.frames.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def wait_opened(self, timeout=10.0):
+        return self._opened.wait(timeout)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is _END:
+                return
+            yield item
+
+
+class PreviewThrottle:
+    """Limite la fréquence de rafraîchissement de l'aperçu annoté"""
+
+    def __init__(self, max_fps=2.0):
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._last = 0.0
+
+    def ready(self):
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+def is_stream(source):
+    """Vrai pour une URL de flux (rtsp, http...) plutôt qu'un fichier local"""
+    return isinstance(source, str) and "://" in source
+
+
+def iter_video_detections(model, source, stride=1, conf=detection.DEFAULT_CONF,
+                          imgsz=detection.DEFAULT_IMGSZ, max_frames=None, gate=None, rois=None, run=None):
+    """Génère (index, horodatage, détections, image BGR, résultat YOLO, réutilisé) pour chaque image analysée.
+
+    Avec un `gating.FrameGate`, les images dont la scène n'a pas changé
+    réutilisent les détections (et le résultat YOLO) de la dernière analyse.
+    Avec des zones d'intérêt (`rois`), seules ces zones sont analysées et le
+    résultat YOLO vaut None. `run(fn)` exécute `fn(modèle)` ailleurs (par
+    exemple sur un `pool_modeles.WorkerPool`) ; sinon `model` est utilisé ici.
+    """
+    reader = FrameReader(source, stride=stride, live=is_stream(source))
+    reader.start()
+    reader.wait_opened()
+    if reader.error:
+        raise IOError(reader.error)
+    analysed = 0
+
+    def infer(frame):
+        def predict_frame(m):
+            if rois:
+                return predict_rois(m, frame, rois, conf=conf, imgsz=imgsz), None
+            r = detection.predict(m, frame, conf=conf, imgsz=imgsz)[0]
+            return detection.extract_detections(m, r), r
+        return run(predict_frame) if run is not None else predict_frame(model)
+
+    try:
+        for index, timestamp, frame in reader:
+            # Les images OpenCV sont déjà en BGR, le format attendu par Ultralytics
+            if gate is None:
+                (dets, r), reused = infer(frame), False
+            else:
+                (dets, r), reused = gate.process(frame, infer)
+            yield index, timestamp, dets, frame, r, reused
+            analysed += 1
+            if max_frames and analysed >= max_frames:
+                break
+    finally:
+        reader.stop()